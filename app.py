@@ -9,7 +9,7 @@ load_dotenv()
 
 # Import the modules we've created
 import config
-import rag_pipeline  # Now using the LlamaIndex pipeline
+import rag_pipeline  # Now using the LlamaIndex pipeline (heavy libraries are imported lazily)
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -90,14 +90,17 @@ def main():
     if not st.session_state.initialized:
         with st.status("Initializing the RAG pipeline...", expanded=True) as status:
             try:
-                status.write("Step 1/3: Initializing LLM and embedding models...")
-                rag_pipeline.initialize_llm_and_embed_model()
+                status.write("Step 1/2: Loading the LLM, embedding model, vector index and drug name index in parallel...")
+                index, timings = rag_pipeline.load_resources()
 
-                status.write("Step 2/3: Loading vector index from storage...")
-                index = rag_pipeline.load_vector_index()
-
-                status.write("Step 3/3: Building the conversational chat engine...")
+                status.write("Step 2/2: Building the conversational chat engine...")
+                start_time = time.perf_counter()
                 st.session_state.query_engine = rag_pipeline.build_query_engine(index)
+                timings["chat engine"] = time.perf_counter() - start_time
+                timings["total"] = timings.pop("total") + timings["chat engine"]
+
+                rag_pipeline.print_startup_breakdown(timings)
+                status.write(" | ".join(f"{phase}: {seconds:.2f}s" for phase, seconds in timings.items()))
                 
                 st.session_state.initialized = True
                 status.update(label="Initialization Complete!", state="complete", expanded=False)
@@ -2,15 +2,33 @@
 # build_knowledge_base.py: One-time script to build and save the vector store
 # =================================================================================
 from llama_index.core import VectorStoreIndex, Document
-from llama_index.core.node_parser import SentenceSplitter
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 import config
 import data_processing
+import chunking
+import rag_pipeline
+import argparse
 import os
+import time
 
-def build_vector_store():
+def build_index(documents, embed_model, manifest_path=config.CHUNK_MANIFEST_PATH):
+    """
+    Chunks the documents and embeds the chunks into a new VectorStoreIndex.
+    Returns the index, the chunk nodes and the embedding time in seconds.
+    """
+    # Split the sections into chunks along their structure (reusing the manifest if possible)
+    nodes = chunking.chunk_documents(documents, manifest_path)
+
+    # Create the LlamaIndex VectorStoreIndex
+    print("Creating the LlamaIndex vector store...")
+    start_time = time.perf_counter()
+    index = VectorStoreIndex(nodes, embed_model=embed_model, show_progress=True)
+    embed_seconds = time.perf_counter() - start_time
+    return index, nodes, embed_seconds
+
+def build_vector_store(chunk_report=config.CHUNK_COMPARISON_REPORT):
     """
     Builds and saves a LlamaIndex vector store from the processed documents.
+    With chunk_report, also compares the chunking with the previous SentenceSplitter.
     """
     # Load and process documents from all sources
     all_docs = data_processing.load_and_process_all()
@@ -24,16 +42,14 @@ def build_vector_store():
     llama_documents = all_docs
 
     # Initialize the embedding model
-    print(f"Loading embedding model: {config.EMBEDDING_MODEL_NAME}...")
-    embed_model = HuggingFaceEmbedding(model_name=config.EMBEDDING_MODEL_NAME)
+    embed_model = rag_pipeline.load_embed_model()
 
-    # Create the LlamaIndex VectorStoreIndex
-    print("Creating the LlamaIndex vector store...")
-    index = VectorStoreIndex.from_documents(
-        llama_documents, 
-        embed_model=embed_model,
-        transformations=[SentenceSplitter(chunk_size=1000, chunk_overlap=150)]
-    )
+    # Chunk and embed the documents
+    index, nodes, embed_seconds = build_index(llama_documents, embed_model)
+
+    # Report the savings compared with the previous fixed-size splitter (re-splits the whole corpus)
+    if chunk_report:
+        chunking.compare_with_sentence_splitter(llama_documents, nodes, embed_seconds=embed_seconds)
 
     # Persist the index to disk
     print(f"Saving the vector store to: {config.LLAMA_INDEX_STORE_PATH}")
@@ -44,11 +60,23 @@ def main():
     """
     Main function to build the knowledge base.
     """
+    parser = argparse.ArgumentParser(description="Build the PharmaBot knowledge base.")
+    parser.add_argument("--chunk-report", action="store_true", default=config.CHUNK_COMPARISON_REPORT,
+                        help="Compare the chunking with the previous SentenceSplitter setup (slow)")
+    args = parser.parse_args()
+
     # Check if the vector store already exists
     if os.path.exists(config.LLAMA_INDEX_STORE_PATH):
         print("Vector store already exists. Skipping build process.")
     else:
-        build_vector_store()
+        build_vector_store(chunk_report=args.chunk_report)
+
+    # Save a warm-start snapshot so the app can start without parsing the store
+    if config.USE_WARM_START_SNAPSHOT and os.path.exists(config.LLAMA_INDEX_STORE_PATH):
+        if rag_pipeline.is_snapshot_current():
+            print("Warm-start snapshot is up to date.")
+        else:
+            rag_pipeline.save_warm_start_snapshot()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,325 @@
+# =================================================================================
+# chunking.py: Structure-aware chunking of FDA label sections
+# =================================================================================
+# dataPrep.py writes one record per label section. Most sections are short enough
+# to embed whole; longer ones are split on the structure FDA labels already have
+# (numbered subsections, bullet lists, tables) instead of a fixed-size window.
+# The resulting character offsets are stored in a chunk manifest so that later
+# builds can reuse them without re-chunking.
+import hashlib
+import json
+import os
+import re
+
+from llama_index.core.schema import TextNode, NodeRelationship, RelatedNodeInfo
+from llama_index.core.utils import get_tokenizer
+import config
+
+# Bump this whenever the splitting rules change so old manifests are ignored.
+CHUNKER_VERSION = "1"
+
+# Metadata added to every chunk; kept out of the embedded and LLM-visible text.
+CHUNK_METADATA_KEYS = ["chunk_id", "chunk_index", "start_char", "end_char", "token_count"]
+
+# Numbered subsection headings such as "1.1 Hypertension" or "5.2.1 Hepatotoxicity".
+SUBSECTION_PATTERN = re.compile(r'(?<!\S)\d{1,2}\.\d{1,2}(?:\.\d{1,2})?\s+(?=[A-Z])')
+# Table captions such as "Table 1:" or "Table 2. Adverse Reactions".
+TABLE_PATTERN = re.compile(r'(?<!\S)Table\s+\d+[:.]?\s')
+# Bullet list items.
+BULLET_PATTERN = re.compile(r'(?<!\S)[•●▪◦]\s')
+# Sentence ends, used only when a single block is larger than the chunk size.
+SENTENCE_PATTERN = re.compile(r'(?<=[.!?;])\s+')
+
+
+def content_hash(text: str) -> str:
+    """Returns a short, stable hash of a section's content."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+def make_chunk_id(doc_id, text: str, chunk_index: int) -> str:
+    """Generates a deterministic chunk ID from the section and its position."""
+    return f"{doc_id}:{content_hash(text)}:{chunk_index}"
+
+
+def count_tokens(text: str, tokenizer=None) -> int:
+    """Counts tokens with the same tokenizer LlamaIndex uses for splitting."""
+    tokenizer = tokenizer or get_tokenizer()
+    return len(tokenizer(text))
+
+
+def find_block_boundaries(text: str):
+    """
+    Returns the sorted start offsets of structural blocks in a section, together
+    with the offsets that begin a numbered subsection.
+    """
+    subsections = {m.start() for m in SUBSECTION_PATTERN.finditer(text)}
+    starts = {0} | subsections
+    starts.update(m.start() for m in TABLE_PATTERN.finditer(text))
+
+    # Consecutive bullet items form a single list block; the list ends after the
+    # first sentence of its last item.
+    list_end = None
+    for match in BULLET_PATTERN.finditer(text):
+        if list_end is None or match.start() > list_end:
+            if list_end is not None:
+                starts.add(list_end)
+            starts.add(match.start())
+        next_sentence = SENTENCE_PATTERN.search(text, match.end())
+        list_end = next_sentence.end() if next_sentence else len(text)
+    if list_end is not None and list_end < len(text):
+        starts.add(list_end)
+
+    return sorted(starts), subsections
+
+
+def split_oversized_block(text: str, start: int, end: int, max_tokens: int, tokenizer):
+    """Splits a block that is larger than max_tokens at sentence boundaries."""
+    pieces = []
+    piece_start = start
+    for match in SENTENCE_PATTERN.finditer(text, start, end):
+        pieces.append((piece_start, match.start()))
+        piece_start = match.end()
+    pieces.append((piece_start, end))
+
+    spans = []
+    for piece_start, piece_end in pieces:
+        tokens = count_tokens(text[piece_start:piece_end], tokenizer)
+        if tokens <= max_tokens:
+            spans.append((piece_start, piece_end, tokens))
+            continue
+        # A single sentence longer than a chunk: fall back to splitting on words.
+        # Tokens per word vary, so each window is re-counted and shrunk until it fits.
+        words = [(m.start(), m.end()) for m in re.finditer(r'\S+', text[piece_start:piece_end])]
+        step = max(1, len(words) * max_tokens // tokens)
+        i = 0
+        while i < len(words):
+            size = min(step, len(words) - i)
+            while True:
+                w_start, w_end = piece_start + words[i][0], piece_start + words[i + size - 1][1]
+                window_tokens = count_tokens(text[w_start:w_end], tokenizer)
+                if window_tokens <= max_tokens or size == 1:
+                    break
+                size = max(1, min(size - 1, size * max_tokens // window_tokens))
+            spans.append((w_start, w_end, window_tokens))
+            i += size
+    return spans
+
+
+def chunk_section(text: str, max_tokens=config.CHUNK_MAX_TOKENS,
+                  min_tokens=config.CHUNK_MIN_TOKENS, tokenizer=None):
+    """
+    Splits a single section into chunks and returns a list of
+    (start_char, end_char, token_count) tuples.
+
+    Sections of up to max_tokens are returned whole. Larger sections are split
+    into structural blocks which are then packed greedily into chunks. A new
+    numbered subsection starts a new chunk once the current one holds at least
+    min_tokens, so unrelated subsections are not mixed unnecessarily.
+    """
+    tokenizer = tokenizer or get_tokenizer()
+    total_tokens = count_tokens(text, tokenizer)
+    if total_tokens <= max_tokens:
+        return [(0, len(text), total_tokens)]
+
+    starts, subsections = find_block_boundaries(text)
+    blocks = []
+    for i, start in enumerate(starts):
+        end = starts[i + 1] if i + 1 < len(starts) else len(text)
+        if not text[start:end].strip():
+            continue
+        tokens = count_tokens(text[start:end], tokenizer)
+        if tokens > max_tokens:
+            pieces = split_oversized_block(text, start, end, max_tokens, tokenizer)
+            blocks.extend((s, e, t, n == 0 and start in subsections)
+                          for n, (s, e, t) in enumerate(pieces))
+        else:
+            blocks.append((start, end, tokens, start in subsections))
+
+    spans = []
+    current_start, current_end, current_tokens = None, None, 0
+    for start, end, tokens, is_subsection in blocks:
+        starts_new = current_start is not None and (
+            current_tokens + tokens > max_tokens
+            or (is_subsection and current_tokens >= min_tokens)
+        )
+        if starts_new:
+            spans.append((current_start, current_end, current_tokens))
+            current_start, current_tokens = None, 0
+        if current_start is None:
+            current_start = start
+        current_end = end
+        current_tokens += tokens
+    if current_start is not None:
+        spans.append((current_start, current_end, current_tokens))
+
+    # Trim surrounding whitespace so offsets point at the chunk text exactly.
+    trimmed = []
+    for start, end, tokens in spans:
+        segment = text[start:end]
+        start += len(segment) - len(segment.lstrip())
+        end -= len(segment) - len(segment.rstrip())
+        trimmed.append((start, end, tokens))
+    return trimmed
+
+
+# --- Chunk Manifest ---
+
+def manifest_settings(max_tokens=config.CHUNK_MAX_TOKENS, min_tokens=config.CHUNK_MIN_TOKENS):
+    """Returns the settings a manifest must match to be reusable."""
+    return {"chunker_version": CHUNKER_VERSION, "max_tokens": max_tokens, "min_tokens": min_tokens}
+
+
+def load_chunk_manifest(manifest_path=config.CHUNK_MANIFEST_PATH, settings=None):
+    """
+    Loads a chunk manifest and returns a dict mapping (doc_id, content_hash) to a
+    list of (start_char, end_char, token_count) spans, ordered by chunk_index.
+    Returns an empty dict if the manifest is missing or was written with
+    different settings.
+    """
+    settings = settings or manifest_settings()
+    if not os.path.exists(manifest_path):
+        return {}
+
+    # Entries are keyed by chunk_index, so a section listed twice cannot grow its span list.
+    spans_by_section = {}
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        header = json.loads(f.readline() or "{}")
+        if header.get("settings") != settings:
+            print("Chunk manifest was written with different settings. Re-chunking all sections.")
+            return {}
+        for line in f:
+            entry = json.loads(line)
+            key = (entry["doc_id"], entry["content_hash"])
+            spans_by_section.setdefault(key, {})[entry["chunk_index"]] = (
+                entry["start_char"], entry["end_char"], entry["token_count"]
+            )
+    return {key: [spans[i] for i in sorted(spans)] for key, spans in spans_by_section.items()}
+
+
+def save_chunk_manifest(entries, manifest_path=config.CHUNK_MANIFEST_PATH, settings=None):
+    """Writes the chunk manifest as a JSON Lines file with a settings header."""
+    settings = settings or manifest_settings()
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({"settings": settings}) + '\n')
+        for entry in entries:
+            f.write(json.dumps(entry) + '\n')
+    print(f"Chunk manifest with {len(entries)} chunks saved to: {manifest_path}")
+
+
+def chunk_documents(documents, manifest_path=config.CHUNK_MANIFEST_PATH,
+                    max_tokens=config.CHUNK_MAX_TOKENS, min_tokens=config.CHUNK_MIN_TOKENS):
+    """
+    Converts section Documents into TextNodes using the structure-aware chunker.
+
+    Sections already present in the chunk manifest (same doc_id and content) reuse
+    their stored offsets; only new or changed sections are chunked. The manifest
+    is rewritten afterwards so it always matches the current corpus.
+
+    Several brands of one generic often carry identical sections under the same
+    doc_id. Those would produce the same chunk IDs, so only the first copy is kept.
+    """
+    settings = manifest_settings(max_tokens, min_tokens)
+    cached_spans = load_chunk_manifest(manifest_path, settings)
+    tokenizer = get_tokenizer()
+
+    nodes = []
+    manifest_entries = []
+    emitted_sections = set()
+    reused_sections = 0
+    duplicate_sections = 0
+    for doc in documents:
+        text = doc.text
+        doc_id = doc.metadata.get("doc_id") or doc.doc_id
+        section_hash = content_hash(text)
+        if (doc_id, section_hash) in emitted_sections:
+            duplicate_sections += 1
+            continue
+        emitted_sections.add((doc_id, section_hash))
+
+        spans = cached_spans.get((doc_id, section_hash))
+        if spans is None:
+            spans = chunk_section(text, max_tokens, min_tokens, tokenizer)
+        else:
+            reused_sections += 1
+
+        for chunk_index, (start, end, tokens) in enumerate(spans):
+            chunk_id = make_chunk_id(doc_id, text, chunk_index)
+            metadata = dict(doc.metadata)
+            metadata.update({
+                "chunk_id": chunk_id,
+                "chunk_index": chunk_index,
+                "start_char": start,
+                "end_char": end,
+                "token_count": tokens,
+            })
+            node = TextNode(
+                id_=chunk_id,
+                text=text[start:end],
+                metadata=metadata,
+                start_char_idx=start,
+                end_char_idx=end,
+                excluded_embed_metadata_keys=list(CHUNK_METADATA_KEYS),
+                excluded_llm_metadata_keys=list(CHUNK_METADATA_KEYS),
+            )
+            node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id=str(doc_id))
+            nodes.append(node)
+            manifest_entries.append({
+                "chunk_id": chunk_id,
+                "doc_id": doc_id,
+                "content_hash": section_hash,
+                "chunk_index": chunk_index,
+                "start_char": start,
+                "end_char": end,
+                "token_count": tokens,
+            })
+
+    print(f"Chunked {len(documents)} sections into {len(nodes)} chunks "
+          f"({reused_sections} sections reused from the manifest, "
+          f"{duplicate_sections} duplicate sections skipped).")
+    save_chunk_manifest(manifest_entries, manifest_path, settings)
+    return nodes
+
+
+def compare_with_sentence_splitter(documents, nodes, embed_seconds=None,
+                                   chunk_size=1000, chunk_overlap=150):
+    """
+    Reports how many chunks (and, if the embedding time of `nodes` is known, how
+    many embedding-seconds) the structure-aware chunker saves compared with the
+    previous SentenceSplitter(chunk_size=1000, chunk_overlap=150) setup.
+
+    This re-splits and tokenizes the whole corpus, so it is only run on request
+    (build_knowledge_base.py --chunk-report). The embedding-seconds saved are an
+    estimate scaled from the token counts, not a measurement.
+    """
+    from llama_index.core.node_parser import SentenceSplitter
+
+    splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    baseline_nodes = splitter.get_nodes_from_documents(documents)
+    tokenizer = get_tokenizer()
+
+    baseline_tokens = sum(count_tokens(n.get_content(), tokenizer) for n in baseline_nodes)
+    chunk_tokens = sum(n.metadata["token_count"] for n in nodes)
+
+    report = {
+        "baseline_chunks": len(baseline_nodes),
+        "chunks": len(nodes),
+        "chunks_saved": len(baseline_nodes) - len(nodes),
+        "baseline_tokens": baseline_tokens,
+        "tokens": chunk_tokens,
+    }
+
+    print("--- Chunking Report ---")
+    print(f"SentenceSplitter chunks:      {report['baseline_chunks']} ({baseline_tokens} tokens)")
+    print(f"Structure-aware chunks:       {report['chunks']} ({chunk_tokens} tokens)")
+    print(f"Chunks saved:                 {report['chunks_saved']}")
+
+    if embed_seconds is not None and chunk_tokens:
+        # Embedding cost is roughly linear in the number of tokens embedded.
+        baseline_seconds = embed_seconds * baseline_tokens / chunk_tokens
+        report["embed_seconds"] = embed_seconds
+        report["estimated_embed_seconds_saved"] = baseline_seconds - embed_seconds
+        print(f"Embedding time:               {embed_seconds:.1f}s "
+              f"(estimated {baseline_seconds:.1f}s with SentenceSplitter)")
+        print(f"Embedding-seconds saved:      ~{report['estimated_embed_seconds_saved']:.1f}s (estimate)")
+    return report
@@ -0,0 +1,190 @@
+# =================================================================================
+# columnar_store.py: Columnar (Parquet / Arrow) storage for the cleaned FDA corpus
+# =================================================================================
+# An alternative to the JSON Lines output of dataPrep.py. Records are written in
+# row-group sized batches to a dataset partitioned by section, with generic_name,
+# brand_name and section dictionary-encoded. Reading supports column projection and
+# predicate pushdown (e.g. only "Boxed Warning" sections), and the uncompressed
+# Arrow format is memory-mapped so reads are zero-copy.
+import os
+import shutil
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import config
+
+# Schema of one cleaned record (one label section per row).
+SCHEMA = pa.schema([
+    ("doc_id", pa.string()),
+    ("generic_name", pa.dictionary(pa.int32(), pa.string())),
+    ("brand_name", pa.dictionary(pa.int32(), pa.string())),
+    ("section", pa.dictionary(pa.int32(), pa.string())),
+    ("content", pa.string()),
+])
+
+# Columns kept dictionary-encoded when reading back.
+DICTIONARY_COLUMNS = ["generic_name", "brand_name", "section"]
+
+# Every file is stored under a section=<name> directory, so section filters
+# skip whole files without opening them.
+PARTITIONING = ds.partitioning(pa.schema([SCHEMA.field("section")]), flavor="hive")
+# When reading, the section dictionary is rebuilt from the directory names.
+READ_PARTITIONING = ds.HivePartitioning.discover(infer_dictionary=True)
+
+SUPPORTED_FORMATS = ("parquet", "arrow")
+
+
+def _file_format(file_format):
+    """Returns the pyarrow dataset format for "parquet" or "arrow"."""
+    if file_format == "parquet":
+        return ds.ParquetFileFormat(
+            read_options=ds.ParquetReadOptions(dictionary_columns=DICTIONARY_COLUMNS)
+        )
+    if file_format == "arrow":
+        return ds.IpcFileFormat()
+    raise ValueError(f"Unsupported columnar format '{file_format}'. Use one of {SUPPORTED_FORMATS}.")
+
+
+class _DictionaryEncoder:
+    """
+    Dictionary-encodes one column across all batches of a write. Values keep
+    their index once seen, so each batch's dictionary extends the previous
+    one; Arrow IPC files then only need dictionary deltas instead of the
+    (unsupported) dictionary replacements that per-batch encoding produces.
+    """
+
+    def __init__(self, field):
+        self.field = field
+        self.values = []
+        self.positions = {}
+
+    def encode(self, column):
+        indices = []
+        for value in column:
+            if value is None:
+                indices.append(None)
+                continue
+            position = self.positions.get(value)
+            if position is None:
+                position = self.positions[value] = len(self.values)
+                self.values.append(value)
+            indices.append(position)
+        return pa.DictionaryArray.from_arrays(
+            pa.array(indices, self.field.type.index_type),
+            pa.array(self.values, self.field.type.value_type),
+        )
+
+
+def _record_batches(records, batch_size):
+    """Groups an iterable of record dicts into Arrow record batches."""
+    encoders = {name: _DictionaryEncoder(SCHEMA.field(name)) for name in DICTIONARY_COLUMNS}
+
+    def to_batch(batch):
+        arrays = []
+        for field in SCHEMA:
+            column = [record.get(field.name) for record in batch]
+            if field.name in encoders:
+                arrays.append(encoders[field.name].encode(column))
+            else:
+                arrays.append(pa.array(column, field.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=SCHEMA)
+
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield to_batch(batch)
+            batch = []
+    if batch:
+        yield to_batch(batch)
+
+
+def write_records(records, output_dir=config.CLEANED_COLUMNAR_PATH,
+                  file_format=config.CLEANED_DATA_FORMAT, row_group_size=config.COLUMNAR_ROW_GROUP_SIZE):
+    """
+    Writes cleaned records to a columnar dataset directory.
+
+    Records are consumed lazily and converted to Arrow in batches of
+    row_group_size, so the whole corpus is never held in memory as Python
+    objects. Parquet files are compressed; Arrow files are left uncompressed so
+    they can be memory-mapped and read without copying. Within each section
+    the records keep their input order, as in the JSONL output. Returns the
+    number of records written.
+    """
+    format_obj = _file_format(file_format)
+    if file_format == "parquet":
+        write_options = format_obj.make_write_options(compression="zstd")
+    else:
+        write_options = format_obj.make_write_options(compression=None, emit_dictionary_deltas=True)
+
+    if os.path.exists(output_dir):
+        shutil.rmtree(output_dir)
+
+    written = 0
+
+    def counted_batches():
+        nonlocal written
+        for batch in _record_batches(records, row_group_size):
+            written += batch.num_rows
+            yield batch
+
+    ds.write_dataset(
+        counted_batches(),
+        output_dir,
+        schema=SCHEMA,
+        format=format_obj,
+        file_options=write_options,
+        partitioning=PARTITIONING,
+        min_rows_per_group=row_group_size,
+        max_rows_per_group=row_group_size,
+        basename_template="part-{i}." + ("parquet" if file_format == "parquet" else "arrow"),
+        existing_data_behavior="overwrite_or_ignore",
+        preserve_order=True,
+    )
+    return written
+
+
+def open_dataset(path=config.CLEANED_COLUMNAR_PATH, file_format=config.CLEANED_DATA_FORMAT):
+    """Opens the columnar dataset with memory-mapped file access."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Columnar dataset not found at {path}. Please run dataPrep.py first.")
+    return ds.dataset(
+        path,
+        format=_file_format(file_format),
+        partitioning=READ_PARTITIONING,
+        filesystem=pafs.LocalFileSystem(use_mmap=True),
+    )
+
+
+def build_filter(sections=None, generic_names=None):
+    """Builds a pushdown filter expression from optional section/generic name lists."""
+    expression = None
+    if sections:
+        expression = ds.field("section").isin(list(sections))
+    if generic_names:
+        name_filter = ds.field("generic_name").isin([name.upper() for name in generic_names])
+        expression = name_filter if expression is None else expression & name_filter
+    return expression
+
+
+def read_table(path=config.CLEANED_COLUMNAR_PATH, file_format=config.CLEANED_DATA_FORMAT,
+               columns=None, sections=None, generic_names=None):
+    """
+    Reads the cleaned corpus as an Arrow table.
+
+    Only the requested columns are read, and only files/row groups that can
+    match the section and generic name filters are scanned, e.g.
+    read_table(columns=["doc_id", "content"], sections=["Boxed Warning"]).
+    """
+    dataset = open_dataset(path, file_format)
+    return dataset.to_table(columns=columns, filter=build_filter(sections, generic_names))
+
+
+def iter_records(path=config.CLEANED_COLUMNAR_PATH, file_format=config.CLEANED_DATA_FORMAT,
+                 columns=None, sections=None, generic_names=None):
+    """Yields the cleaned records as dicts, one record batch at a time."""
+    dataset = open_dataset(path, file_format)
+    scanner = dataset.scanner(columns=columns, filter=build_filter(sections, generic_names))
+    for batch in scanner.to_batches():
+        yield from batch.to_pylist()
@@ -17,6 +17,12 @@ EMBEDDING_MODEL_NAME = "pritamdeka/S-BioBert-snli-multinli-stsb"
 RAW_DATA_PATH = "../fda_data_raw/drug_labels_all.json"
 # Path to the cleaned/processed data
 CLEANED_DATA_PATH = "fda_data/fda_data_processed.jsonl"
+# Format of the cleaned data: "jsonl", or the columnar "parquet" / "arrow"
+CLEANED_DATA_FORMAT = "jsonl"
+# Directory of the columnar dataset (used when CLEANED_DATA_FORMAT is "parquet" or "arrow")
+CLEANED_COLUMNAR_PATH = "fda_data/fda_data_processed_columnar"
+# Number of records per row group / record batch in the columnar dataset
+COLUMNAR_ROW_GROUP_SIZE = 10000
 
 # The name of the folder where the vector database will be saved
 VECTOR_STORE_PATH = "llamaIndexVectorBase_fda"
@@ -26,6 +32,65 @@ VECTOR_STORE_PATH = "llamaIndexVectorBase_fda"
 # =================================================================================
 LLAMA_INDEX_STORE_PATH = "./llamaIndexVectorBase_fda"
 
+# =================================================================================
+# Sharded Build (shard_build.py)
+# =================================================================================
+# Number of shards the cleaned data is split into (by doc_id hash)
+SHARD_COUNT = 4
+# Where the per-shard JSONL files and the per-shard vector stores are written
+SHARD_DATA_DIR = "fda_data/shards"
+SHARD_STORE_DIR = "./llamaIndexVectorBase_fda_shards"
+
+# =================================================================================
+# Startup Settings
+# =================================================================================
+# Snapshot of the loaded index and a local copy of the embedding model for fast startup
+WARM_START_SNAPSHOT_PATH = "./warm_start_snapshot"
+# Load from the snapshot when it matches the current vector store
+USE_WARM_START_SNAPSHOT = True
+
+# =================================================================================
+# Multi-Worker Deployment (serve_workers.py)
+# =================================================================================
+# Number of forked chat worker processes
+WORKER_COUNT = 4
+# Host and port of worker 0; worker n listens on WORKER_BASE_PORT + n
+WORKER_HOST = "127.0.0.1"
+WORKER_BASE_PORT = 8600
+# Chat sessions kept per worker before the least recently used ones are dropped
+WORKER_MAX_SESSIONS = 1000
+# Torch threads per worker; the workers themselves provide the parallelism
+WORKER_TORCH_THREADS = 1
+# A worker exiting sooner than this after starting counts as a failed start;
+# restarts then back off exponentially (up to WORKER_RESTART_MAX_DELAY seconds)
+WORKER_MIN_UPTIME = 10
+WORKER_RESTART_MAX_DELAY = 30
+# The server stops after this many failed starts of one worker in a row
+WORKER_MAX_FAST_FAILURES = 5
+
+# =================================================================================
+# Chunking Settings
+# =================================================================================
+# Sections up to this many tokens are embedded whole; longer ones are split
+# on numbered subsections, bullet lists and tables.
+CHUNK_MAX_TOKENS = 1000
+# A numbered subsection only starts a new chunk once the current chunk has this many tokens.
+CHUNK_MIN_TOKENS = 128
+# Chunk offsets from the last build, reused so unchanged sections are not re-chunked
+CHUNK_MANIFEST_PATH = "fda_data/chunk_manifest.jsonl"
+# Compare each build with the previous SentenceSplitter setup; re-splits the whole corpus, so off by default
+CHUNK_COMPARISON_REPORT = False
+
+# =================================================================================
+# Drug Name Resolution
+# =================================================================================
+# Brand/generic alias index built by dataPrep.py, used to target retrieval
+NAME_INDEX_PATH = "fda_data/name_index.json"
+# Aliases that map to more generics than this (e.g. "Pain Relief") are dropped as ambiguous
+NAME_MAX_GENERICS_PER_ALIAS = 3
+# Retrieved chunks always left to plain similarity search when a query names drugs
+NAME_DENSE_SLOTS = 2
+
 # =================================================================================
 # Data Source Paths
 # =================================================================================
@@ -3,6 +3,8 @@ import re
 from tqdm import tqdm
 import os
 import config
+import columnar_store
+import name_resolver
 
 # --- Functions from dataOrganize.py ---
 
@@ -82,6 +84,8 @@ def organize_drug_data(input_path):
             organized_entry = {
                 "brand_name": brand_name,
                 "generic_name": generic_name,
+                "brand_names": brand_name_list or [],
+                "generic_names": generic_name_list or [],
                 "sections": processed_sections
             }
             organized_data.append(organized_entry)
@@ -134,15 +138,13 @@ def generate_section_id(section_title):
     else:
         return "section"
 
-def transform_drug_data(drugs, output_file_path):
+def iter_drug_records(drugs):
     """
-    Transforms drug data to a JSON Lines format.
+    Yields one cleaned record per drug section.
     """
-    print(f"Transforming {len(drugs)} drugs to JSONL format...")
-    processed_records = []
-
     for drug in drugs:
         generic_name = drug.get('generic_name')
+        brand_name = drug.get('brand_name')
         sections = drug.get('sections')
 
         if not generic_name or not isinstance(sections, dict):
@@ -156,6 +158,9 @@ def transform_drug_data(drugs, output_file_path):
 
         generic_name_upper = generic_name.upper()
 
+        if isinstance(brand_name, list):
+            brand_name = brand_name[0] if brand_name else None
+
         for section_title, section_content in sections.items():
             if not section_title or not section_content:
                 continue
@@ -163,21 +168,42 @@ def transform_drug_data(drugs, output_file_path):
             section_id = generate_section_id(section_title)
             doc_id = f"{generic_name_upper.replace(' ', '_')}_{section_id}"
 
-            record = {
+            yield {
                 "doc_id": doc_id,
                 "generic_name": generic_name_upper,
+                "brand_name": brand_name,
                 "section": section_title,
                 "content": section_content.strip()
             }
-            processed_records.append(json.dumps(record))
+
+def transform_drug_data(drugs, output_file_path):
+    """
+    Transforms drug data to a JSON Lines format.
+    """
+    print(f"Transforming {len(drugs)} drugs to JSONL format...")
+    record_count = 0
 
     os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
     with open(output_file_path, 'w') as f_out:
-        f_out.write('\n'.join(processed_records))
+        for record in iter_drug_records(drugs):
+            if record_count:
+                f_out.write('\n')
+            f_out.write(json.dumps(record))
+            record_count += 1
 
-    print(f"Transformation complete. {len(processed_records)} records created.")
+    print(f"Transformation complete. {record_count} records created.")
     print(f"Transformed data saved to: {output_file_path}")
 
+def transform_drug_data_columnar(drugs, output_dir, file_format):
+    """
+    Transforms drug data to a columnar (Parquet or Arrow) dataset.
+    """
+    print(f"Transforming {len(drugs)} drugs to {file_format} format...")
+    record_count = columnar_store.write_records(iter_drug_records(drugs), output_dir, file_format)
+
+    print(f"Transformation complete. {record_count} records created.")
+    print(f"Transformed data saved to: {output_dir}")
+
 
 if __name__ == '__main__':
     # Define file paths using config
@@ -190,10 +216,16 @@ if __name__ == '__main__':
     # Step 1: Organize and clean the raw data in memory
     organized_data = organize_drug_data(raw_data_path)
     
-    # Step 2: Deduplicate the cleaned data in memory
+    # Step 2: Build the brand/generic name index from every label (before deduplication)
+    name_resolver.save_name_index(name_resolver.build_name_index(organized_data))
+
+    # Step 3: Deduplicate the cleaned data in memory
     deduplicated_data = deduplicate_drugs(organized_data)
     
-    # Step 3: Transform the deduplicated data and write to the final file
-    transform_drug_data(deduplicated_data, cleaned_data_path)
+    # Step 4: Transform the deduplicated data and write to the final file
+    if config.CLEANED_DATA_FORMAT == "jsonl":
+        transform_drug_data(deduplicated_data, cleaned_data_path)
+    else:
+        transform_drug_data_columnar(deduplicated_data, config.CLEANED_COLUMNAR_PATH, config.CLEANED_DATA_FORMAT)
     
     print("--- Data Preparation Pipeline Finished ---")
@@ -6,6 +6,7 @@ import re
 from llama_index.core import Document
 from tqdm import tqdm
 import config
+import columnar_store
 
 def clean_text(text: str) -> str:
     """
@@ -84,7 +85,10 @@ def load_and_process_all():
     all_docs = []
 
     # Process FDA drug data
-    fda_docs = load_and_prepare_fda_documents()
+    if config.CLEANED_DATA_FORMAT == "jsonl":
+        fda_docs = load_and_prepare_fda_documents()
+    else:
+        fda_docs = load_and_prepare_fda_documents_columnar()
     all_docs.extend(fda_docs)
 
     # Process HealthCareMagic data
@@ -136,3 +140,38 @@ def load_and_prepare_fda_documents(json_path=config.CLEANED_DATA_PATH):
     print(f"Created {len(all_docs)} 'Document' objects from the cleaned FDA data.")
     return all_docs
 
+def load_and_prepare_fda_documents_columnar(path=config.CLEANED_COLUMNAR_PATH,
+                                            file_format=config.CLEANED_DATA_FORMAT,
+                                            sections=None, generic_names=None):
+    """
+    Loads cleaned drug data from the columnar (Parquet/Arrow) dataset and converts
+    it into a list of LlamaIndex Document objects. Optional section and generic
+    name filters are pushed down to the reader, e.g. sections=["Boxed Warning"].
+    """
+    print(f"Loading cleaned drug data from: {path} ({file_format})...")
+    all_docs = []
+    try:
+        records = columnar_store.iter_records(path, file_format, sections=sections, generic_names=generic_names)
+        for entry in tqdm(records, desc="Processing cleaned drug data"):
+            content = entry.get("content")
+            if not content:
+                continue
+
+            metadata = {
+                "doc_id": entry.get("doc_id"),
+                "brand_name": entry.get("brand_name"),
+                "generic_name": entry.get("generic_name"),
+                "section": entry.get("section"),
+                "source": "FDA Drug Labels"
+            }
+
+            doc = Document(text=content, metadata=metadata)
+            all_docs.append(doc)
+
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        return []
+
+    print(f"Created {len(all_docs)} 'Document' objects from the cleaned FDA data.")
+    return all_docs
+
@@ -0,0 +1,486 @@
+# =================================================================================
+# name_resolver.py: Resolve brand, generic and misspelled drug names to generics
+# =================================================================================
+# Users refer to drugs by brand names, misspellings and Turkish/Spanish spellings
+# ("Advil", "ibuprofeno", "parasetamol", "amoksisilin"). This module keeps every
+# brand and generic alias found in the openFDA labels and maps query mentions to
+# the canonical generic_name used in the cleaned corpus, so retrieval can be
+# restricted to the right drug instead of relying on dense similarity alone.
+#
+# Lookups go through three levels, cheapest first:
+#   1. exact match on the normalized alias,
+#   2. exact match on a spelling-insensitive "phonetic" key,
+#   3. bounded edit distance over phonetic keys, with candidates taken from a
+#      trigram index bucketed by key length.
+# Common words ("allergy", "sleep", "clear") are never matched fuzzily, and brand
+# names that are just common words are left out of the index, as are one-word
+# generic names with an everyday meaning ("alcohol", "water").
+import json
+import os
+import re
+import unicodedata
+from collections import defaultdict
+from functools import lru_cache
+
+import numpy as np
+import config
+
+NAME_INDEX_VERSION = 3
+
+# International (INN/BAN) names that differ from the US names used in openFDA.
+INTERNATIONAL_SYNONYMS = {
+    "paracetamol": "acetaminophen",
+    "salbutamol": "albuterol",
+    "adrenaline": "epinephrine",
+    "noradrenaline": "norepinephrine",
+    "lignocaine": "lidocaine",
+    "frusemide": "furosemide",
+    "glibenclamide": "glyburide",
+    "pethidine": "meperidine",
+    "aciclovir": "acyclovir",
+    "amoxycillin": "amoxicillin",
+    "cyclosporin": "cyclosporine",
+    "rifampicin": "rifampin",
+    "metamizole": "dipyrone",
+    "bendrofluazide": "bendroflumethiazide",
+    "phenobarbitone": "phenobarbital",
+}
+
+# Domain words added to the NLTK word lists (already normalized).
+STOPWORDS = {
+    # English
+    "what", "which", "when", "where", "with", "about", "effects", "side", "dose", "dosage",
+    "take", "taking", "should", "could", "would", "there", "their", "between", "interaction",
+    "interactions", "pregnancy", "pregnant", "children", "warning", "warnings", "after", "before",
+    "pain", "headache", "fever", "drug", "drugs", "medicine", "tablet", "tablets",
+    # Turkish
+    "nedir", "nelerdir", "nasil", "ilac", "ilaci", "yan", "etkileri", "etkisi", "kullanilir",
+    "hamilelik", "arasindaki", "farklar", "icin", "agrisi", "doz", "dozu",
+    # Spanish
+    "cuales", "efectos", "secundarios", "para", "sirve", "dosis", "embarazo", "medicamento",
+    "entre", "tomar", "dolor",
+    # Everyday substances that are also generic names of OTC labels
+    "alcohol", "water", "oxygen", "nitrogen", "salt", "sugar", "honey", "menthol", "camphor",
+    "charcoal", "sulfur", "zinc", "iron", "glycerin", "petrolatum", "lanolin", "dextrose",
+}
+
+# One-word generic names kept in the index although they are also common words.
+DRUG_WORDS = {
+    "aspirin", "caffeine", "insulin", "nicotine", "morphine", "codeine", "heroin", "penicillin",
+    "heparin", "quinine", "iodine", "lithium", "melatonin", "digitalis", "atropine", "cocaine",
+    "ephedrine", "epinephrine", "adrenaline", "estrogen", "progesterone", "testosterone",
+    "cortisone", "hydrocortisone", "niacin", "fluoride", "calamine", "benzocaine", "lidocaine",
+    "procaine", "tetracycline", "streptomycin", "thyroxine", "warfarin",
+}
+
+# Salt and ester words dropped to form an extra alias ("metformin hydrochloride" -> "metformin").
+SALT_WORDS = {
+    "hydrochloride", "hcl", "hydrobromide", "sodium", "potassium", "calcium", "magnesium",
+    "phosphate", "sulfate", "citrate", "maleate", "besylate", "mesylate", "tartrate", "succinate",
+    "acetate", "fumarate", "bromide", "chloride", "monohydrate", "dihydrate", "anhydrous",
+}
+
+# Mentions up to this many words are looked up as a single alias.
+MAX_ALIAS_WORDS = 4
+
+# Shorter words are only matched exactly; fuzzy matches on short words are mostly noise.
+FUZZY_MIN_LENGTH = 6
+# Keys longer than this share one length bucket in the trigram index.
+MAX_BUCKET_LENGTH = 32
+# Fuzzy lookup results kept per resolver; the same misspellings come up again and again.
+FUZZY_CACHE_SIZE = 10000
+
+# Characters of phonetic keys plus the "$" padding; trigrams are stored as base-38 integers.
+TRIGRAM_ALPHABET = "$ 0123456789abcdefghijklmnopqrstuvwxyz"
+TRIGRAM_CODES = {char: i for i, char in enumerate(TRIGRAM_ALPHABET)}
+_CHAR_CODES = np.zeros(256, dtype=np.int64)
+_CHAR_CODES[[ord(char) for char in TRIGRAM_ALPHABET]] = np.arange(len(TRIGRAM_ALPHABET))
+
+_SOFT_C_PATTERN = re.compile(r"c(?=[ei])")
+_DOUBLE_LETTER_PATTERN = re.compile(r"(.)\1+")
+
+
+def normalize_name(text: str) -> str:
+    """Lowercases, strips accents and punctuation, and collapses whitespace."""
+    text = text.replace("ı", "i").replace("İ", "I")
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[^a-z0-9]+", " ", text.casefold())
+    return text.strip()
+
+
+def phonetic_key(name: str) -> str:
+    """
+    Returns a spelling-insensitive key for a normalized name, so that e.g.
+    "amoxicillin", "amoksisilin" and "amoxicilina" share the same key.
+    """
+    return " ".join(_phonetic_word(word) for word in name.split())
+
+
+@lru_cache(maxsize=200000)
+def _phonetic_word(word: str) -> str:
+    """phonetic_key of a single word; cached, since aliases share many words."""
+    word = word.replace("ph", "f").replace("th", "t").replace("ck", "k").replace("qu", "k")
+    word = word.replace("x", "ks").replace("y", "i").replace("w", "v").replace("z", "s")
+    word = _SOFT_C_PATTERN.sub("s", word).replace("c", "k")
+    word = _DOUBLE_LETTER_PATTERN.sub(r"\1", word)
+    # Spanish/Turkish endings: "ibuprofeno" -> "ibuprofen", "codeina" -> "codein"
+    if len(word) > 5 and word[-1] in "aeo":
+        word = word[:-1]
+    return word
+
+
+def max_edits(length: int) -> int:
+    """Returns the number of edits tolerated for a key of the given length."""
+    if length < FUZZY_MIN_LENGTH:
+        return 0
+    if length <= 8:
+        return 1
+    return 2
+
+
+def bounded_edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance between a and b, or limit + 1 if it exceeds limit."""
+    too_far = limit + 1
+    if abs(len(a) - len(b)) > limit:
+        return too_far
+    # Only cells within `limit` of the diagonal can stay within range.
+    previous = [j if j <= limit else too_far for j in range(len(b) + 1)]
+    for i, char_a in enumerate(a, 1):
+        current = [too_far] * (len(b) + 1)
+        current[0] = row_min = i if i <= limit else too_far
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            value = previous[j - 1] if char_a == b[j - 1] else previous[j - 1] + 1
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return too_far
+        previous = current
+    return previous[-1] if previous[-1] <= limit else too_far
+
+
+def trigrams(key: str):
+    """Returns the padded character trigrams of a key."""
+    padded = f"$${key}$$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def sorted_runs(values):
+    """
+    Returns (unique values, start offsets, run lengths) of a sorted integer array;
+    np.unique does the same but is much slower on large arrays.
+    """
+    starts = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+    return values[starts], starts, np.diff(np.append(starts, len(values)))
+
+
+def trigram_code(gram: str) -> int:
+    """Encodes a trigram of TRIGRAM_ALPHABET characters as an integer."""
+    return (TRIGRAM_CODES[gram[0]] * 38 + TRIGRAM_CODES[gram[1]]) * 38 + TRIGRAM_CODES[gram[2]]
+
+
+def strip_salts(alias: str) -> str:
+    """Removes salt words from a normalized generic name."""
+    return " ".join(word for word in alias.split() if word not in SALT_WORDS)
+
+
+def load_common_words():
+    """
+    Returns the set of common words: the NLTK English word list and the English,
+    Turkish and Spanish stopword lists, plus STOPWORDS. Falls back to STOPWORDS
+    alone if the NLTK corpora have not been downloaded.
+    """
+    common_words = set(STOPWORDS)
+    try:
+        from nltk.corpus import stopwords, words
+
+        # Capitalized entries of the word list are proper nouns, which include brand names.
+        common_words.update(word.lower() for word in words.words() if word.islower())
+        for language in ("english", "turkish", "spanish"):
+            common_words.update(normalize_name(word) for word in stopwords.words(language))
+    except LookupError:
+        print("NLTK word lists not found (run: python -m nltk.downloader words stopwords). "
+              "Using the built-in stopword list only.")
+    common_words.discard("")
+    return common_words
+
+
+def is_common_word(word: str, common_words) -> bool:
+    """True if a normalized word, or the word without a plural or verb ending, is a common word."""
+    if word in common_words:
+        return True
+    if word.endswith("ies") and word[:-3] + "y" in common_words:
+        return True
+    return any(word.endswith(suffix) and word[:-len(suffix)] in common_words
+               for suffix in ("s", "es", "ed", "ing", "ly"))
+
+
+# --- Building the Index ---
+
+def build_name_index(organized_data, common_words=None):
+    """
+    Builds the alias table from the output of dataPrep.organize_drug_data().
+
+    Every brand and generic name on every label becomes an alias of that label's
+    canonical generic (the uppercased first generic name, as in the cleaned
+    corpus). Aliases shared by more than NAME_MAX_GENERICS_PER_ALIAS generics
+    (e.g. "Pain Relief") are too ambiguous to be useful and are dropped, as are
+    brand names made up of common words only (e.g. "Clear", "Cold & Flu") and
+    one-word generic names that are common words (e.g. "Alcohol", "Water"),
+    unless they are listed in DRUG_WORDS.
+    """
+    print(f"Building name index from {len(organized_data)} drug entries...")
+    common_words = load_common_words() if common_words is None else common_words
+    alias_targets = defaultdict(set)
+    generic_aliases, brand_aliases = set(), set()
+
+    for drug in organized_data:
+        generic_names = drug.get("generic_names") or [drug.get("generic_name")]
+        brand_names = drug.get("brand_names") or [drug.get("brand_name")]
+        generic_names = [name for name in generic_names if name and name != "Unknown Generic"]
+        if not generic_names:
+            continue
+
+        canonical = generic_names[0].upper()
+        names = [normalize_name(name) for name in generic_names]
+        names += [strip_salts(name) for name in names]
+        for alias in names:
+            if alias:
+                alias_targets[alias].add(canonical)
+                generic_aliases.add(alias)
+        for name in brand_names:
+            alias = normalize_name(name) if name and name != "Unknown Brand" else ""
+            if alias:
+                alias_targets[alias].add(canonical)
+                brand_aliases.add(alias)
+
+    # Brand names that are ordinary words would match everyday questions.
+    dropped = 0
+    for alias in sorted(brand_aliases):
+        if alias not in generic_aliases and all(is_common_word(word, common_words) for word in alias.split()):
+            del alias_targets[alias]
+            dropped += 1
+    print(f"Dropped {dropped} brand names made up of common words.")
+
+    # So would one-word generics such as "alcohol" (hand sanitizers) or "water".
+    # Longer generic names ("isopropyl alcohol", "zinc oxide") are specific enough.
+    dropped = 0
+    for alias in sorted(generic_aliases):
+        if " " not in alias and alias not in DRUG_WORDS and is_common_word(alias, common_words):
+            del alias_targets[alias]
+            dropped += 1
+    print(f"Dropped {dropped} one-word generic names that are common words.")
+
+    # International names point at whatever their US equivalent resolves to.
+    for international, us_name in INTERNATIONAL_SYNONYMS.items():
+        if us_name in alias_targets:
+            alias_targets[international] |= alias_targets[us_name]
+
+    canonicals = sorted({c for targets in alias_targets.values() for c in targets})
+    canonical_ids = {name: i for i, name in enumerate(canonicals)}
+    aliases = {
+        alias: sorted(canonical_ids[c] for c in targets)
+        for alias, targets in sorted(alias_targets.items())
+        if len(targets) <= config.NAME_MAX_GENERICS_PER_ALIAS
+    }
+
+    print(f"Name index built: {len(aliases)} aliases for {len(canonicals)} generics.")
+    return {"version": NAME_INDEX_VERSION, "canonicals": canonicals, "aliases": aliases}
+
+
+def save_name_index(name_index, index_path=config.NAME_INDEX_PATH):
+    """Saves the name index as a compact JSON file."""
+    os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+    with open(index_path, 'w', encoding='utf-8') as f:
+        json.dump(name_index, f, ensure_ascii=False, separators=(",", ":"))
+    print(f"Name index saved to: {index_path}")
+
+
+# --- Resolving Names ---
+
+class NameResolver:
+    """
+    Resolves drug mentions in free text to canonical generic names.
+    """
+
+    def __init__(self, name_index, common_words=None):
+        self.canonicals = name_index["canonicals"]
+        self.aliases = {alias: tuple(ids) for alias, ids in name_index["aliases"].items()}
+        self.max_alias_words = min(MAX_ALIAS_WORDS, max((a.count(" ") + 1 for a in self.aliases), default=1))
+        self.common_words = load_common_words() if common_words is None else common_words
+
+        # Phonetic keys and the trigram index over them.
+        phonetic = defaultdict(set)
+        for alias, ids in self.aliases.items():
+            phonetic[phonetic_key(alias)].update(ids)
+        self.phonetic_keys = sorted(phonetic)
+        self.phonetic_targets = [tuple(sorted(phonetic[key])) for key in self.phonetic_keys]
+        self.phonetic_lookup = {key: i for i, key in enumerate(self.phonetic_keys)}
+        self._build_trigram_postings()
+        self._fuzzy_cache = {}
+
+    def _build_trigram_postings(self):
+        """
+        Builds the trigram index as one int32 array of key ids sorted by
+        (trigram, key length, key id), with the start offset of every
+        (trigram, key length) bucket. The keys of one trigram within a range of
+        lengths are then a single contiguous slice. The trigrams of every key
+        are kept as well (key_grams, sliced by key_gram_starts).
+        """
+        keys = self.phonetic_keys
+        lengths = np.fromiter(map(len, keys), dtype=np.int64, count=len(keys))
+        codes = _CHAR_CODES[np.frombuffer("".join(f"$${key}$$" for key in keys).encode("ascii"), dtype=np.uint8)]
+
+        # Position of every padded trigram in the joined string, and the key it belongs to.
+        gram_counts = lengths + 2
+        key_ids = np.repeat(np.arange(len(keys), dtype=np.int64), gram_counts)
+        first_gram = np.cumsum(gram_counts) - gram_counts
+        positions = (np.repeat(np.cumsum(lengths + 4) - (lengths + 4), gram_counts)
+                     + np.arange(int(gram_counts.sum())) - np.repeat(first_gram, gram_counts))
+        grams = (codes[positions] * 38 + codes[positions + 1]) * 38 + codes[positions + 2]
+        buckets = grams * (MAX_BUCKET_LENGTH + 1) + np.minimum(lengths, MAX_BUCKET_LENGTH)[key_ids]
+
+        # One entry per (bucket, key), sorted by bucket.
+        pairs, _, _ = sorted_runs(np.sort((buckets << 32) | key_ids))
+        self.posting_keys = (pairs & 0xFFFFFFFF).astype(np.int32)
+        self.bucket_ids, starts, _ = sorted_runs(pairs >> 32)
+        self.bucket_starts = np.append(starts, len(pairs))
+
+        by_key = np.argsort(self.posting_keys, kind="stable")
+        self.key_grams = ((pairs >> 32) // (MAX_BUCKET_LENGTH + 1))[by_key].astype(np.int32)
+        self.key_gram_counts = np.bincount(self.posting_keys, minlength=len(keys))
+        self.key_gram_starts = np.cumsum(self.key_gram_counts) - self.key_gram_counts
+
+    @classmethod
+    def load(cls, index_path=config.NAME_INDEX_PATH):
+        """Loads a resolver from a saved name index."""
+        if not os.path.exists(index_path):
+            raise FileNotFoundError(f"Name index not found at {index_path}. Please run dataPrep.py first.")
+        with open(index_path, 'r', encoding='utf-8') as f:
+            name_index = json.load(f)
+        if name_index.get("version") != NAME_INDEX_VERSION:
+            raise ValueError(f"Name index at {index_path} is outdated. Please run dataPrep.py again.")
+        return cls(name_index)
+
+    def _names(self, ids):
+        return [self.canonicals[i] for i in ids]
+
+    def _fuzzy_lookup(self, key):
+        """Returns (distance, canonical ids) for the closest phonetic key within range."""
+        limit = max_edits(len(key))
+        if limit == 0:
+            return None
+
+        if any(char not in TRIGRAM_CODES for char in key):
+            return None
+
+        # Keys within `limit` edits differ in length by at most `limit`, and
+        # each edit changes at most 3 padded trigrams of either key, so a match
+        # shares at least `required` trigrams with the query.
+        grams = np.array([trigram_code(gram) for gram in trigrams(key)], dtype=np.int64)
+        required = len(grams) - 3 * limit
+        buckets = grams * (MAX_BUCKET_LENGTH + 1)
+        starts = self.bucket_starts[np.searchsorted(self.bucket_ids, buckets + max(1, len(key) - limit))]
+        ends = self.bucket_starts[np.searchsorted(
+            self.bucket_ids, buckets + min(len(key) + limit, MAX_BUCKET_LENGTH), side="right"
+        )]
+
+        # A key sharing `required` of the trigrams contains at least one of any
+        # len(grams) - required + 1 of them, so candidates only come from the
+        # rarest ones; the very common trigrams ("$$a", "ne$") are never scanned.
+        probed = len(grams) - required + 1 if required > 0 else len(grams)
+        rarest = np.argsort(ends - starts, kind="stable")[:probed].tolist()
+        slices = [self.posting_keys[starts[i]:ends[i]] for i in rarest if ends[i] > starts[i]]
+        if not slices:
+            return None
+        key_ids, _, _ = sorted_runs(np.sort(np.concatenate(slices)))
+
+        # Shared trigrams of every candidate, from its own trigram list.
+        gram_counts = self.key_gram_counts[key_ids]
+        offsets = np.cumsum(gram_counts) - gram_counts
+        key_grams = self.key_grams[np.repeat(self.key_gram_starts[key_ids] - offsets, gram_counts)
+                                   + np.arange(int(gram_counts.sum()))]
+        in_query = np.zeros(len(TRIGRAM_ALPHABET) ** 3, dtype=np.uint8)
+        in_query[grams] = 1
+        counts = np.add.reduceat(in_query[key_grams], offsets, dtype=np.int64)
+
+        keep = counts >= np.maximum(np.maximum(len(grams), gram_counts) - 3 * limit, 1)
+        key_ids, counts = key_ids[keep], counts[keep]
+
+        # Candidates sharing the most trigrams are checked first; each match
+        # tightens the edit bound, so the remaining checks stop early.
+        best = None
+        for key_id in key_ids[np.argsort(-counts, kind="stable")].tolist():
+            distance = bounded_edit_distance(key, self.phonetic_keys[key_id], limit)
+            if distance <= limit:
+                best = (distance, self.phonetic_targets[key_id])
+                if distance <= 1:
+                    break
+                limit = distance - 1
+        return best
+
+    def resolve(self, name: str, fuzzy=True):
+        """
+        Resolves a single name to a list of canonical generic names, or an empty
+        list if it is unknown.
+        """
+        alias = normalize_name(name)
+        if not alias:
+            return []
+        if alias in self.aliases:
+            return self._names(self.aliases[alias])
+        # Common words only match an alias exactly (e.g. "aspirin"), never by spelling.
+        if all(is_common_word(word, self.common_words) for word in alias.split()):
+            return []
+
+        key = phonetic_key(alias)
+        if key in self.phonetic_lookup:
+            return self._names(self.phonetic_targets[self.phonetic_lookup[key]])
+
+        if fuzzy:
+            if key not in self._fuzzy_cache:
+                if len(self._fuzzy_cache) >= FUZZY_CACHE_SIZE:
+                    self._fuzzy_cache.clear()
+                self._fuzzy_cache[key] = self._fuzzy_lookup(key)
+            match = self._fuzzy_cache[key]
+            if match:
+                return self._names(match[1])
+        return []
+
+    def find_mentions(self, text: str):
+        """
+        Finds drug mentions in a query and returns a list of
+        (mention, [canonical generic names]) tuples, in order of appearance.
+
+        Longer mentions win over shorter ones ("acetaminophen and codeine" over
+        "codeine"); fuzzy matching is only tried for single words that are not
+        common words.
+        """
+        words = normalize_name(text).split()
+        mentions = []
+        position = 0
+        while position < len(words):
+            for size in range(min(self.max_alias_words, len(words) - position), 0, -1):
+                mention = " ".join(words[position:position + size])
+                if size == 1 and len(mention) < 3:
+                    continue
+                generics = self.resolve(mention, fuzzy=size == 1)
+                if generics:
+                    mentions.append((mention, generics))
+                    position += size
+                    break
+            else:
+                position += 1
+        return mentions
+
+    def resolve_query(self, text: str):
+        """Returns the unique canonical generic names mentioned in a query."""
+        generics = []
+        for _, names in self.find_mentions(text):
+            generics.extend(name for name in names if name not in generics)
+        return generics
@@ -1,21 +1,34 @@
 # =================================================================================
 # rag_pipeline.py: Create the Gemini model and the RAG chain
 # =================================================================================
-from llama_index.core import VectorStoreIndex, StorageContext, load_index_from_storage
-from llama_index.llms.gemini import Gemini
-from llama_index.core.prompts.base import PromptTemplate
-from llama_index.core.prompts import ChatPromptTemplate
-from llama_index.core.llms import ChatMessage, MessageRole
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.core import Settings
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
+# The heavy libraries (llama_index, the Gemini SDK, torch/transformers) are
+# imported inside the functions that need them, so importing this module is
+# cheap and the Streamlit page can render before the pipeline is loaded.
+from concurrent.futures import ThreadPoolExecutor
+import importlib
+import json
+import pickle
+import time
 import config
+import name_resolver
 import os
 
-def initialize_llm_and_embed_model():
+# Files inside the warm-start snapshot directory
+SNAPSHOT_STORAGE_FILE = "storage_context.pkl"
+SNAPSHOT_EMBED_MODEL_DIR = "embed_model"
+SNAPSHOT_MANIFEST_FILE = "snapshot.json"
+
+# Imported up front by load_resources, one at a time (see import_heavy_modules)
+HEAVY_MODULES = ["llama_index.core", "llama_index.embeddings.huggingface"]
+LLM_MODULES = ["llama_index.llms.gemini", "google.generativeai.types"]
+
+def load_llm():
     """
-    Initializes and sets the global LLM and embedding model for LlamaIndex.
+    Creates the Gemini LLM.
     """
+    from llama_index.llms.gemini import Gemini
+    from google.generativeai.types import HarmCategory, HarmBlockThreshold
+
     print(f"Initializing Gemini model: {config.LLM_MODEL_ID}...")
     
     # Define safety settings to be less restrictive, especially for medical content
@@ -33,47 +46,216 @@ def initialize_llm_and_embed_model():
         "You always respond in the user's language and maintain conversation context throughout the session."
     )
 
-    llm = Gemini(
+    return Gemini(
         model_name=config.LLM_MODEL_ID, 
         temperature=0.3,
         safety_settings=safety_settings,
         generation_config={"candidate_count": 1},
         system_instruction=system_instruction  # Add system instruction
     )
-    
-    print(f"Loading embedding model: {config.EMBEDDING_MODEL_NAME}...")
+
+def load_embed_model(model_name=config.EMBEDDING_MODEL_NAME):
+    """
+    Loads the HuggingFace embedding model, either by hub name or from a local directory.
+    """
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    print(f"Loading embedding model: {model_name}...")
     
     # Get the token from environment variables
     hf_token = os.getenv("HUGGING_FACE_TOKEN")
-    if not hf_token:
+    if not hf_token and not os.path.isdir(model_name):
         print("Warning: HUGGING_FACE_TOKEN environment variable not set.")
 
-    embed_model = HuggingFaceEmbedding(
-        model_name=config.EMBEDDING_MODEL_NAME,
+    return HuggingFaceEmbedding(
+        model_name=model_name,
         token=hf_token
     )
+
+def initialize_llm_and_embed_model():
+    """
+    Initializes and sets the global LLM and embedding model for LlamaIndex.
+    """
+    from llama_index.core import Settings
+
+    llm = load_llm()
+    embed_model = load_embed_model()
     
     # Set the global models for LlamaIndex
     Settings.llm = llm
     Settings.embed_model = embed_model
 
-def load_vector_index():
+def load_storage_context():
     """
-    Loads the LlamaIndex vector index from storage.
+    Parses the persisted LlamaIndex store into a StorageContext.
     """
+    from llama_index.core import StorageContext
+
     if not os.path.exists(config.LLAMA_INDEX_STORE_PATH):
         raise FileNotFoundError(f"LlamaIndex store not found at {config.LLAMA_INDEX_STORE_PATH}. Please run build_knowledge_base.py first.")
-    
+
     print("Loading LlamaIndex vector store...")
-    storage_context = StorageContext.from_defaults(persist_dir=config.LLAMA_INDEX_STORE_PATH)
+    return StorageContext.from_defaults(persist_dir=config.LLAMA_INDEX_STORE_PATH)
+
+def load_vector_index():
+    """
+    Loads the LlamaIndex vector index from storage.
+    """
+    from llama_index.core import load_index_from_storage
+
+    storage_context = load_storage_context()
     index = load_index_from_storage(storage_context)
     return index
 
-from llama_index.core.memory import ChatMemoryBuffer
+# --- Warm-Start Snapshot ---
+
+def _store_fingerprint():
+    """
+    Identifies the current persisted store, so stale snapshots can be detected.
+    """
+    fingerprint = {}
+    for file_name in sorted(os.listdir(config.LLAMA_INDEX_STORE_PATH)):
+        stat = os.stat(os.path.join(config.LLAMA_INDEX_STORE_PATH, file_name))
+        fingerprint[file_name] = [stat.st_size, stat.st_mtime_ns]
+    return {"embedding_model": config.EMBEDDING_MODEL_NAME, "store_files": fingerprint}
+
+def is_snapshot_current(snapshot_dir=config.WARM_START_SNAPSHOT_PATH):
+    """
+    Returns True if a warm-start snapshot exists and matches the persisted store.
+    """
+    manifest_path = os.path.join(snapshot_dir, SNAPSHOT_MANIFEST_FILE)
+    if not os.path.exists(manifest_path) or not os.path.exists(config.LLAMA_INDEX_STORE_PATH):
+        return False
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return json.load(f) == _store_fingerprint()
 
-def build_query_engine(index):
+def save_warm_start_snapshot(snapshot_dir=config.WARM_START_SNAPSHOT_PATH, embed_model=None):
+    """
+    Saves a snapshot of the loaded resources for fast startup: the parsed
+    StorageContext as a pickle and the embedding model as a local copy, so
+    startup needs neither JSON parsing nor a model download.
+    """
+    storage_context = load_storage_context()
+    embed_model = embed_model or load_embed_model()
+
+    print(f"Saving warm-start snapshot to: {snapshot_dir}")
+    os.makedirs(snapshot_dir, exist_ok=True)
+    with open(os.path.join(snapshot_dir, SNAPSHOT_STORAGE_FILE), 'wb') as f:
+        pickle.dump(storage_context, f, protocol=pickle.HIGHEST_PROTOCOL)
+    embed_model._model.save(os.path.join(snapshot_dir, SNAPSHOT_EMBED_MODEL_DIR))
+
+    # The manifest is written last, so an interrupted save is never treated as current.
+    with open(os.path.join(snapshot_dir, SNAPSHOT_MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(_store_fingerprint(), f)
+    print("Warm-start snapshot saved successfully.")
+
+def _load_snapshot_storage_context(snapshot_dir):
+    """
+    Loads the pickled StorageContext from a warm-start snapshot.
+    """
+    print(f"Loading LlamaIndex vector store from snapshot: {snapshot_dir}...")
+    with open(os.path.join(snapshot_dir, SNAPSHOT_STORAGE_FILE), 'rb') as f:
+        return pickle.load(f)
+
+# --- Startup ---
+
+def _timed(timings, phase, func, *args):
+    """
+    Runs func(*args) and records its duration in timings[phase].
+    """
+    start_time = time.perf_counter()
+    result = func(*args)
+    timings[phase] = time.perf_counter() - start_time
+    return result
+
+def import_heavy_modules(with_llm=True):
+    """
+    Imports llama_index and the model libraries on the calling thread.
+    llama_index has circular imports that deadlock when several threads import
+    it for the first time at once, so the loaders must not trigger them.
+    """
+    for module_name in HEAVY_MODULES + (LLM_MODULES if with_llm else []):
+        importlib.import_module(module_name)
+
+def print_startup_breakdown(timings):
+    """
+    Prints how long each startup phase took.
+    """
+    print("--- Startup Time Breakdown ---")
+    for phase, seconds in timings.items():
+        print(f"{phase:<28}{seconds:>8.2f}s")
+
+def load_resources(use_snapshot=config.USE_WARM_START_SNAPSHOT, with_llm=True):
+    """
+    Loads the LLM, the embedding model, the vector index and the drug name
+    resolver in parallel and sets them as the LlamaIndex globals. Uses the warm-start snapshot when it
+    is current, falling back to the persisted store and the model hub.
+    With with_llm=False the LLM is skipped (see serve_workers.py).
+
+    Returns the index and a dict of per-phase timings (in seconds).
+    """
+    timings = {}
+    start_time = time.perf_counter()
+
+    snapshot_dir = config.WARM_START_SNAPSHOT_PATH
+    use_snapshot = use_snapshot and is_snapshot_current(snapshot_dir)
+    if use_snapshot:
+        embed_model_name = os.path.join(snapshot_dir, SNAPSHOT_EMBED_MODEL_DIR)
+        load_storage = lambda: _load_snapshot_storage_context(snapshot_dir)
+    else:
+        embed_model_name = config.EMBEDDING_MODEL_NAME
+        load_storage = load_storage_context
+
+    # Imports run serially first; the loads are then independent and spend
+    # their time in disk I/O and native code, so threads overlap them well.
+    _timed(timings, "imports", import_heavy_modules, with_llm)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        llm_future = executor.submit(_timed, timings, "llm", load_llm) if with_llm else None
+        embed_future = executor.submit(_timed, timings, "embedding model", load_embed_model, embed_model_name)
+        storage_future = executor.submit(
+            _timed, timings, "storage (snapshot)" if use_snapshot else "storage (json)", load_storage
+        )
+        # Cached in _name_resolver, so build_query_engine does not load it again.
+        resolver_future = executor.submit(_timed, timings, "name resolver", load_name_resolver)
+        llm = llm_future.result() if with_llm else None
+        embed_model = embed_future.result()
+        storage_context = storage_future.result()
+        resolver_future.result()
+
+    def build_index():
+        from llama_index.core import Settings, load_index_from_storage
+
+        if llm is not None:
+            Settings.llm = llm
+        Settings.embed_model = embed_model
+        return load_index_from_storage(storage_context, embed_model=embed_model)
+
+    index = _timed(timings, "index", build_index)
+    timings["total"] = time.perf_counter() - start_time
+    return index, timings
+
+_name_resolver = None
+
+def load_name_resolver():
+    """
+    Loads the drug name resolver, or returns None if the name index has not been built.
+    The resolver is loaded once and shared by all chat engines in the process.
+    """
+    global _name_resolver
+    if _name_resolver is None:
+        try:
+            _name_resolver = name_resolver.NameResolver.load()
+        except (FileNotFoundError, ValueError) as e:
+            print(f"Warning: {e} Falling back to dense retrieval only.")
+            return None
+    return _name_resolver
+
+def build_query_engine(index, retriever_factory=None):
     """
     Builds a query engine from the LlamaIndex vector index.
+
+    retriever_factory(filters) can be given instead of an index to retrieve from
+    another source, e.g. the shared embedding matrix used by serve_workers.py.
     """
     
     # Condensed, action-oriented prompt that guides behavior without being conversational
@@ -115,22 +297,48 @@ def build_query_engine(index):
         "Answer (in same language as query):"
     )
     
+    from llama_index.core import Settings
+    from llama_index.core.prompts.base import PromptTemplate
+    from llama_index.core.memory import ChatMemoryBuffer
+    from llama_index.core.chat_engine import ContextChatEngine
+    from retrievers import NameAwareRetriever
+
     qa_template = PromptTemplate(qa_template_str)
 
     print("Building query engine...")
     
     memory = ChatMemoryBuffer.from_defaults(token_limit=3000)
-    
+
+    system_prompt = (
+        "You are PharmaBot, an AI pharmaceutical information assistant. "
+        "Always respond in the user's language. Use FDA drug label data to answer medical queries. "
+        "Never diagnose or prescribe. Include disclaimers on medical responses."
+    )
+
+    if retriever_factory is None:
+        retriever_factory = lambda filters: index.as_retriever(similarity_top_k=5, filters=filters)
+
+    # Target retrieval at the drugs named in the query when the name index is available
+    resolver = load_name_resolver()
+    if resolver is not None or index is None:
+        if resolver is not None:
+            retriever = NameAwareRetriever(retriever_factory, resolver, similarity_top_k=5)
+        else:
+            retriever = retriever_factory(None)
+        return ContextChatEngine.from_defaults(
+            retriever=retriever,
+            memory=memory,
+            system_prompt=system_prompt,
+            context_template=qa_template,
+            llm=Settings.llm,
+        )
+
     # Use simple chat mode to avoid condense_question_prompt issues
     # The chat mode will still maintain conversation history through memory
     query_engine = index.as_chat_engine(
         chat_mode="context",  # Changed from "condense_question" to "context"
         memory=memory,
-        system_prompt=(
-            "You are PharmaBot, an AI pharmaceutical information assistant. "
-            "Always respond in the user's language. Use FDA drug label data to answer medical queries. "
-            "Never diagnose or prescribe. Include disclaimers on medical responses."
-        ),
+        system_prompt=system_prompt,
         context_template=qa_template,  # Use our custom template
         similarity_top_k=5,
         verbose=True
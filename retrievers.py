@@ -0,0 +1,217 @@
+# =================================================================================
+# retrievers.py: Custom LlamaIndex retrievers used by the RAG pipeline
+# =================================================================================
+import json
+import mmap
+
+import numpy as np
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+from llama_index.core.vector_stores import MetadataFilters, MetadataFilter, FilterOperator
+import config
+
+
+class NameAwareRetriever(BaseRetriever):
+    """
+    Retriever that targets the drugs named in the query.
+
+    Brand names, misspellings and international spellings in the query are
+    resolved to canonical generic names. Chunks of those drugs are retrieved
+    first (filtered on generic_name), with an equal share of the slots for each
+    named drug, and at least dense_slots slots are always left to ordinary
+    dense retrieval results.
+    """
+
+    def __init__(self, retriever_factory, resolver, similarity_top_k=5, dense_slots=config.NAME_DENSE_SLOTS):
+        # retriever_factory(filters) returns a retriever restricted by the given MetadataFilters (or None)
+        self._retriever_factory = retriever_factory
+        self._resolver = resolver
+        self._similarity_top_k = similarity_top_k
+        self._targeted_slots = max(1, similarity_top_k - dense_slots)
+        self._dense_retriever = retriever_factory(None)
+        super().__init__()
+
+    def _retrieve(self, query_bundle):
+        generics = self._resolver.resolve_query(query_bundle.query_str)
+        dense_nodes = self._dense_retriever.retrieve(query_bundle)
+        if not generics:
+            return dense_nodes
+
+        print(f"Resolved drug names in query: {generics}")
+        # Split the targeted slots evenly so one drug cannot crowd out the others
+        # ("warfarin and ibuprofen"); unused slots go to the dense results.
+        generics = generics[:self._targeted_slots]
+        quota, extra = divmod(self._targeted_slots, len(generics))
+
+        merged_nodes = []
+        seen_ids = set()
+
+        def add_nodes(nodes, limit):
+            for node in nodes:
+                if limit == 0 or len(merged_nodes) >= self._similarity_top_k:
+                    break
+                if node.node.node_id not in seen_ids:
+                    seen_ids.add(node.node.node_id)
+                    merged_nodes.append(node)
+                    limit -= 1
+
+        for i, generic in enumerate(generics):
+            filters = MetadataFilters(
+                filters=[MetadataFilter(key="generic_name", value=generic, operator=FilterOperator.EQ)]
+            )
+            add_nodes(self._retriever_factory(filters).retrieve(query_bundle), quota + (1 if i < extra else 0))
+        add_nodes(dense_nodes, self._similarity_top_k)
+        return merged_nodes
+
+
+class SharedEmbeddingMatrix:
+    """
+    All node embeddings of a SimpleVectorStore as one normalized float32 matrix
+    in an anonymous shared memory mapping.
+
+    Processes forked after it is built see the same physical pages, so every
+    worker can search the full index without its own copy of the embeddings.
+    """
+
+    def __init__(self, node_ids, embeddings, generic_names):
+        dim = len(embeddings[0])
+        self.node_ids = node_ids
+        self._buffer = mmap.mmap(-1, len(node_ids) * dim * 4)
+        self.matrix = np.ndarray((len(node_ids), dim), dtype=np.float32, buffer=self._buffer)
+        for row, embedding in enumerate(embeddings):
+            self.matrix[row] = embedding
+        # Normalize once so a dot product gives the cosine similarity SimpleVectorStore uses.
+        norms = np.linalg.norm(self.matrix, axis=1, keepdims=True)
+        self.matrix /= np.where(norms == 0, 1, norms)
+        self.matrix.flags.writeable = False
+
+        # generic_name per row as integer codes, for metadata filtering.
+        self.generic_name_codes = {name: i for i, name in enumerate(sorted({n for n in generic_names if n}))}
+        self.generic_codes = np.array(
+            [self.generic_name_codes.get(name, -1) for name in generic_names], dtype=np.int32
+        )
+
+    @classmethod
+    def from_index(cls, index):
+        """
+        Copies the embeddings out of a VectorStoreIndex backed by a SimpleVectorStore
+        and releases the per-node Python lists they were stored in.
+        """
+        data = index.vector_store.data
+        node_ids = sorted(data.embedding_dict)
+        embeddings = [data.embedding_dict[node_id] for node_id in node_ids]
+        generic_names = []
+        for node_id in node_ids:
+            metadata = data.metadata_dict.get(node_id) or index.docstore.get_node(node_id).metadata
+            generic_names.append(metadata.get("generic_name"))
+
+        shared = cls(node_ids, embeddings, generic_names)
+        data.embedding_dict.clear()
+        return shared
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes
+
+    def search(self, query_embedding, top_k, generic_names=None):
+        """
+        Returns the top_k (node_id, score) pairs by cosine similarity, optionally
+        restricted to rows whose generic_name is in generic_names.
+        """
+        return [(self.node_ids[row], score) for row, score in self.search_rows(query_embedding, top_k, generic_names)]
+
+    def search_rows(self, query_embedding, top_k, generic_names=None):
+        """Like search, but returns (row, score) pairs."""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        scores = self.matrix @ query
+
+        if generic_names is not None:
+            wanted = [self.generic_name_codes[name] for name in generic_names if name in self.generic_name_codes]
+            scores = np.where(np.isin(self.generic_codes, wanted), scores, -np.inf)
+
+        top_k = min(top_k, len(scores))
+        if top_k == 0:
+            return []
+        top_rows = np.argpartition(-scores, top_k - 1)[:top_k]
+        top_rows = top_rows[np.argsort(-scores[top_rows])]
+        return [(int(row), float(scores[row])) for row in top_rows if np.isfinite(scores[row])]
+
+
+class SharedNodeStore:
+    """
+    Node texts and metadata, serialized as in the docstore, in an anonymous
+    shared memory mapping, one record per row of a SharedEmbeddingMatrix.
+
+    A docstore keeps every node as Python objects; reading them changes their
+    reference counts, so each forked worker would gradually copy the pages
+    they live on. Here a worker only deserializes the nodes it returns.
+    """
+
+    def __init__(self, nodes):
+        records = [json.dumps(doc_to_json(node), ensure_ascii=False).encode('utf-8') for node in nodes]
+        offsets = np.zeros(len(records) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(record) for record in records])
+        self._buffer = mmap.mmap(-1, max(1, int(offsets[-1])))
+        for record, start in zip(records, offsets):
+            self._buffer[start:start + len(record)] = record
+        self._offsets = offsets
+        self._offsets.flags.writeable = False
+
+    @classmethod
+    def from_docstore(cls, docstore, node_ids):
+        """Copies the nodes with the given IDs (e.g. SharedEmbeddingMatrix.node_ids) out of a docstore."""
+        return cls(docstore.get_nodes(node_ids))
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    @property
+    def nbytes(self):
+        return int(self._offsets[-1])
+
+    def get_node(self, row):
+        start, end = self._offsets[row], self._offsets[row + 1]
+        return json_to_doc(json.loads(self._buffer[start:end]))
+
+
+class SharedMatrixRetriever(BaseRetriever):
+    """
+    Retriever over a SharedEmbeddingMatrix, with node texts read from the
+    SharedNodeStore built in the same row order.
+
+    Only generic_name filters (EQ or IN) are supported, which is what
+    NameAwareRetriever uses.
+    """
+
+    def __init__(self, shared_matrix, node_store, embed_model, similarity_top_k=5, filters=None):
+        self._shared_matrix = shared_matrix
+        self._node_store = node_store
+        self._embed_model = embed_model
+        self._similarity_top_k = similarity_top_k
+        self._generic_names = self._parse_filters(filters)
+        super().__init__()
+
+    @staticmethod
+    def _parse_filters(filters):
+        if filters is None:
+            return None
+        generic_names = []
+        for metadata_filter in filters.filters:
+            if metadata_filter.key != "generic_name":
+                raise ValueError(f"SharedMatrixRetriever only supports generic_name filters, got '{metadata_filter.key}'.")
+            if metadata_filter.operator == FilterOperator.IN:
+                generic_names.extend(metadata_filter.value)
+            elif metadata_filter.operator == FilterOperator.EQ:
+                generic_names.append(metadata_filter.value)
+            else:
+                raise ValueError(f"Unsupported filter operator for generic_name: {metadata_filter.operator}")
+        return generic_names
+
+    def _retrieve(self, query_bundle):
+        if query_bundle.embedding is None:
+            query_bundle.embedding = self._embed_model.get_agg_embedding_from_queries(query_bundle.embedding_strs)
+
+        results = self._shared_matrix.search_rows(query_bundle.embedding, self._similarity_top_k, self._generic_names)
+        return [NodeWithScore(node=self._node_store.get_node(row), score=score) for row, score in results]
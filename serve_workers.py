@@ -0,0 +1,327 @@
+# =================================================================================
+# serve_workers.py: Multi-worker chat server with a shared read-only index
+# =================================================================================
+# A pre-fork deployment mode for running several chat workers on one host.
+# The master process loads the embedding model and the vector index once,
+# moves all node embeddings and node texts into shared memory and then forks
+# the workers. The workers share the model weights, the embedding matrix and the
+# node store with the master (copy-on-write) and only hold their own chat
+# sessions, so each extra worker costs little RAM. Each worker reports its
+# private (unshared) memory at startup and in /health.
+#
+# Each worker serves a small JSON HTTP API on its own port (base port + worker
+# number). Put a load balancer with session affinity in front of the workers,
+# since chat sessions live in the worker that created them:
+#   POST /chat   {"session_id": "...", "message": "..."} -> {"response": "...", "worker": n}
+#   POST /reset  {"session_id": "..."}
+#   GET  /health
+#
+# Usage: python serve_workers.py [--workers N] [--host HOST] [--port BASE_PORT]
+import argparse
+import gc
+import json
+import os
+import signal
+import sys
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from dotenv import load_dotenv
+import config
+import rag_pipeline
+
+
+class SharedIndex:
+    """
+    The read-only resources loaded by the master and inherited by the workers.
+    """
+
+    def __init__(self, embed_model, node_store, shared_matrix):
+        self.embed_model = embed_model
+        self.node_store = node_store
+        self.shared_matrix = shared_matrix
+
+    def retriever_factory(self, filters, similarity_top_k=5):
+        """Returns a retriever over the shared matrix (used by rag_pipeline.build_query_engine)."""
+        from retrievers import SharedMatrixRetriever
+
+        return SharedMatrixRetriever(
+            self.shared_matrix, self.node_store, self.embed_model,
+            similarity_top_k=similarity_top_k, filters=filters,
+        )
+
+
+def load_shared_index():
+    """
+    Loads the embedding model, the vector index and the name resolver in the
+    master (so the workers inherit them) and moves the embeddings and node texts
+    into shared memory. The index itself (and its docstore) is then dropped.
+    The LLM is not loaded here: its gRPC client is not fork-safe, so every
+    worker creates its own after forking.
+    """
+    from llama_index.core import Settings
+    from retrievers import SharedEmbeddingMatrix, SharedNodeStore
+
+    index, timings = rag_pipeline.load_resources(with_llm=False)
+    start_time = time.perf_counter()
+    shared_matrix = SharedEmbeddingMatrix.from_index(index)
+    timings["shared matrix"] = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    node_store = SharedNodeStore.from_docstore(index.docstore, shared_matrix.node_ids)
+    timings["shared node store"] = time.perf_counter() - start_time
+    rag_pipeline.print_startup_breakdown(timings)
+    print(f"Shared embedding matrix: {shared_matrix.matrix.shape[0]} nodes, "
+          f"{shared_matrix.nbytes / 1024 ** 2:.1f} MB")
+    print(f"Shared node store: {len(node_store)} nodes, {node_store.nbytes / 1024 ** 2:.1f} MB")
+    return SharedIndex(Settings.embed_model, node_store, shared_matrix)
+
+
+def private_memory_mb():
+    """
+    Returns the private (not shared with the master) memory of this process in
+    MB, or None where /proc/self/smaps_rollup is not available (e.g. macOS).
+    """
+    try:
+        with open("/proc/self/smaps_rollup", encoding="utf-8") as f:
+            kilobytes = sum(int(line.split()[1]) for line in f if line.startswith(("Private_Clean:", "Private_Dirty:")))
+    except OSError:
+        return None
+    return kilobytes / 1024
+
+
+# --- Worker ---
+
+class ChatWorker:
+    """
+    Per-worker state: the LLM client and the chat sessions of this worker.
+    """
+
+    def __init__(self, worker_id, shared_index, max_sessions=config.WORKER_MAX_SESSIONS):
+        self.worker_id = worker_id
+        self.shared_index = shared_index
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+
+    def get_chat_engine(self, session_id):
+        """Returns the chat engine of a session, creating it if needed (least recently used sessions are dropped)."""
+        if session_id in self.sessions:
+            self.sessions.move_to_end(session_id)
+            return self.sessions[session_id]
+
+        chat_engine = rag_pipeline.build_query_engine(None, retriever_factory=self.shared_index.retriever_factory)
+        self.sessions[session_id] = chat_engine
+        if len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+        return chat_engine
+
+    def chat(self, session_id, message):
+        response = self.get_chat_engine(session_id).chat(message)
+        return str(response.response)
+
+    def reset(self, session_id):
+        self.sessions.pop(session_id, None)
+
+
+class ChatRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON HTTP handler; the ChatWorker is available as self.server.worker.
+    """
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/health":
+            worker = self.server.worker
+            self._send_json(200, {"status": "ok", "worker": worker.worker_id, "sessions": len(worker.sessions),
+                                  "private_memory_mb": private_memory_mb()})
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        worker = self.server.worker
+        try:
+            payload = self._read_json()
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": "Request body must be JSON."})
+            return
+
+        session_id = payload.get("session_id")
+        if not session_id:
+            self._send_json(400, {"error": "session_id is required."})
+            return
+
+        if self.path == "/chat":
+            message = payload.get("message")
+            if not message:
+                self._send_json(400, {"error": "message is required."})
+                return
+            try:
+                response_text = worker.chat(session_id, message)
+            except Exception as e:
+                self._send_json(500, {"error": f"An unexpected error occurred: {e}"})
+                return
+            self._send_json(200, {"response": response_text, "worker": worker.worker_id})
+        elif self.path == "/reset":
+            worker.reset(session_id)
+            self._send_json(200, {"status": "reset", "worker": worker.worker_id})
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def log_message(self, format, *args):
+        print(f"[worker {self.server.worker.worker_id}] {self.address_string()} - {format % args}")
+
+
+def run_worker(worker_id, shared_index, host, port):
+    """
+    Entry point of a forked worker: creates its own LLM client and serves chat requests.
+    """
+    import torch
+    from llama_index.core import Settings
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # One compute thread per worker; parallelism comes from the worker processes.
+    torch.set_num_threads(config.WORKER_TORCH_THREADS)
+
+    Settings.llm = rag_pipeline.load_llm()
+    Settings.embed_model = shared_index.embed_model
+
+    server = HTTPServer((host, port), ChatRequestHandler)
+    server.worker = ChatWorker(worker_id, shared_index)
+    memory_mb = private_memory_mb()
+    memory_note = f", {memory_mb:.1f} MB private memory" if memory_mb is not None else ""
+    print(f"Worker {worker_id} (pid {os.getpid()}) serving on http://{host}:{port}{memory_note}")
+    server.serve_forever()
+
+
+# --- Master ---
+
+def fork_worker(worker_id, shared_index, host, port):
+    """
+    Forks a worker process and returns its pid.
+    """
+    pid = os.fork()
+    if pid == 0:
+        exit_code = 0
+        try:
+            run_worker(worker_id, shared_index, host, port)
+        except SystemExit as e:
+            exit_code = e.code or 0
+        except Exception as e:
+            print(f"Worker {worker_id} failed: {e}")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+    return pid
+
+
+def serve(num_workers=config.WORKER_COUNT, host=config.WORKER_HOST, base_port=config.WORKER_BASE_PORT):
+    """
+    Loads the shared index, forks the workers and restarts any worker that exits.
+
+    Restarts back off exponentially while a worker keeps exiting within
+    WORKER_MIN_UPTIME seconds of starting. After WORKER_MAX_FAST_FAILURES such
+    exits in a row (e.g. its port is in use or the LLM client cannot be
+    created) the whole server is stopped instead of forking forever.
+    """
+    if not hasattr(os, "fork"):
+        raise RuntimeError("serve_workers.py requires a platform with os.fork (Linux or macOS).")
+
+    # Tokenizer thread pools do not survive fork; the workers run single-threaded instead.
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    shared_index = load_shared_index()
+
+    # Move everything loaded so far out of the garbage collector's reach, so the
+    # workers do not touch (and copy) those pages during collections.
+    gc.collect()
+    gc.freeze()
+
+    workers = {}
+    started_at = {}
+    fast_failures = [0] * num_workers
+
+    def start_worker(worker_id):
+        pid = fork_worker(worker_id, shared_index, host, base_port + worker_id)
+        workers[pid] = worker_id
+        started_at[worker_id] = time.monotonic()
+
+    for worker_id in range(num_workers):
+        start_worker(worker_id)
+
+    shutting_down = False
+    failed = False
+
+    def shutdown(signum, frame):
+        nonlocal shutting_down
+        shutting_down = True
+        print("Shutting down workers...")
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        worker_id = workers.pop(pid, None)
+        if worker_id is None or shutting_down:
+            continue
+
+        exit_code = os.waitstatus_to_exitcode(status)
+        if time.monotonic() - started_at[worker_id] < config.WORKER_MIN_UPTIME:
+            fast_failures[worker_id] += 1
+        else:
+            fast_failures[worker_id] = 0
+        if fast_failures[worker_id] >= config.WORKER_MAX_FAST_FAILURES:
+            print(f"Worker {worker_id} (pid {pid}) exited with code {exit_code}; it failed "
+                  f"{fast_failures[worker_id]} times in a row within {config.WORKER_MIN_UPTIME}s "
+                  "of starting. Stopping the server.")
+            failed = True
+            shutdown(None, None)
+            continue
+
+        delay = min(2 ** fast_failures[worker_id], config.WORKER_RESTART_MAX_DELAY)
+        print(f"Worker {worker_id} (pid {pid}) exited with code {exit_code}. Restarting in {delay}s...")
+        time.sleep(delay)
+        if not shutting_down:
+            start_worker(worker_id)
+
+    print("All workers stopped.")
+    if failed:
+        raise SystemExit(1)
+
+
+def main():
+    """
+    Main function to start the multi-worker server.
+    """
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run PharmaBot chat workers sharing one read-only index.")
+    parser.add_argument("--workers", type=int, default=config.WORKER_COUNT, help="Number of worker processes")
+    parser.add_argument("--host", default=config.WORKER_HOST, help="Host to bind the workers to")
+    parser.add_argument("--port", type=int, default=config.WORKER_BASE_PORT,
+                        help="Port of worker 0; worker n listens on port + n")
+    args = parser.parse_args()
+    serve(args.workers, args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+# =================================================================================
+# shard_build.py: Sharded knowledge-base build and deterministic merge
+# =================================================================================
+# Splits the cleaned data (JSONL or the columnar dataset, per
+# config.CLEANED_DATA_FORMAT) into per-shard JSONL files by a stable hash of
+# doc_id so the shards can be built independently (in separate processes or on separate machines), then merges
+# the shard stores into one index at config.LLAMA_INDEX_STORE_PATH.
+#
+#   python shard_build.py split  --shards 4    # write fda_data/shards/shard_000.jsonl ...
+#   python shard_build.py build  --shard 2     # embed one shard (run once per shard)
+#   python shard_build.py merge                # merge all shard stores into one index
+#   python shard_build.py verify --shards 4    # check sharded == monolithic build
+#
+# Chunk IDs only depend on doc_id and content (see chunking.make_chunk_id), and
+# all sections with the same doc_id go to the same shard, so the merged index
+# contains exactly the nodes of a monolithic build. The merge orders everything
+# by node ID and uses a fixed index ID, so it is deterministic.
+import argparse
+import glob
+import hashlib
+import itertools
+import json
+import os
+import random
+import shutil
+import tempfile
+
+from llama_index.core import StorageContext
+from llama_index.core.data_structs import IndexDict
+import numpy as np
+import config
+import columnar_store
+import data_processing
+import build_knowledge_base
+import rag_pipeline
+
+# Index ID of the merged index; fixed so repeated merges produce identical stores.
+MERGED_INDEX_ID = "pharmabot_fda_merged"
+
+
+def shard_for_doc_id(doc_id, num_shards):
+    """Returns the shard number of a doc_id (stable across processes and machines)."""
+    digest = hashlib.md5(str(doc_id).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], "big") % num_shards
+
+
+def shard_data_path(shard_id, data_dir=config.SHARD_DATA_DIR):
+    return os.path.join(data_dir, f"shard_{shard_id:03d}.jsonl")
+
+
+def shard_store_path(shard_id, store_dir=config.SHARD_STORE_DIR):
+    return os.path.join(store_dir, f"shard_{shard_id:03d}")
+
+
+def list_shard_stores(store_dir=config.SHARD_STORE_DIR):
+    """Returns the built shard store directories, in shard order."""
+    return sorted(path for path in glob.glob(os.path.join(store_dir, "shard_*")) if os.path.isdir(path))
+
+
+# --- Split ---
+
+def default_input_path(file_format=config.CLEANED_DATA_FORMAT):
+    """Returns where the cleaned data of the given format is stored."""
+    return config.CLEANED_DATA_PATH if file_format == "jsonl" else config.CLEANED_COLUMNAR_PATH
+
+
+def iter_cleaned_lines(input_path, file_format=config.CLEANED_DATA_FORMAT):
+    """
+    Yields (doc_id, JSON line) for every cleaned record. JSONL lines are
+    passed through unchanged; columnar records are serialized like dataPrep.py
+    writes them.
+    """
+    if file_format == "jsonl":
+        if not os.path.exists(input_path):
+            raise FileNotFoundError(f"Cleaned data not found at {input_path}. Please run dataPrep.py first.")
+        with open(input_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line).get("doc_id"), line.rstrip('\n')
+    elif file_format in columnar_store.SUPPORTED_FORMATS:
+        for record in columnar_store.iter_records(input_path, file_format):
+            yield record.get("doc_id"), json.dumps(record)
+    else:
+        raise ValueError(f"Unsupported CLEANED_DATA_FORMAT '{file_format}'. "
+                         f"Use 'jsonl' or one of {columnar_store.SUPPORTED_FORMATS}.")
+
+
+def split_cleaned_data(num_shards=config.SHARD_COUNT, input_path=None,
+                       data_dir=config.SHARD_DATA_DIR, file_format=config.CLEANED_DATA_FORMAT):
+    """
+    Splits the cleaned data into num_shards JSON Lines files by doc_id hash.
+    The input is read in file_format (config.CLEANED_DATA_FORMAT by default)
+    from input_path, or from the configured path of that format. Records keep
+    their relative order within a shard.
+    """
+    input_path = input_path or default_input_path(file_format)
+    records = iter_cleaned_lines(input_path, file_format)
+    first_record = next(records, None)  # fail before creating any shard files
+
+    print(f"Splitting {input_path} ({file_format}) into {num_shards} shards...")
+    os.makedirs(data_dir, exist_ok=True)
+    shard_files = [open(shard_data_path(i, data_dir), 'w', encoding='utf-8') for i in range(num_shards)]
+    counts = [0] * num_shards
+    try:
+        if first_record is not None:
+            for doc_id, line in itertools.chain([first_record], records):
+                shard_id = shard_for_doc_id(doc_id, num_shards)
+                if counts[shard_id]:
+                    shard_files[shard_id].write('\n')
+                shard_files[shard_id].write(line)
+                counts[shard_id] += 1
+    finally:
+        for shard_file in shard_files:
+            shard_file.close()
+
+    for shard_id, count in enumerate(counts):
+        print(f"Shard {shard_id}: {count} records -> {shard_data_path(shard_id, data_dir)}")
+    return counts
+
+
+# --- Build ---
+
+def build_shard(shard_id, data_dir=config.SHARD_DATA_DIR, store_dir=config.SHARD_STORE_DIR, embed_model=None):
+    """
+    Builds and persists the vector store of a single shard. Each shard keeps its
+    own chunk manifest, so shards can be built on different machines.
+    """
+    documents = data_processing.load_and_prepare_fda_documents(shard_data_path(shard_id, data_dir))
+    output_dir = shard_store_path(shard_id, store_dir)
+    if not documents:
+        print(f"Shard {shard_id} has no documents. Skipping.")
+        return None
+
+    embed_model = embed_model or rag_pipeline.load_embed_model()
+    manifest_path = os.path.join(store_dir, f"shard_{shard_id:03d}_chunk_manifest.jsonl")
+    index, nodes, embed_seconds = build_knowledge_base.build_index(documents, embed_model, manifest_path)
+    print(f"Shard {shard_id}: {len(nodes)} chunks embedded in {embed_seconds:.1f}s")
+
+    print(f"Saving shard {shard_id} to: {output_dir}")
+    index.storage_context.persist(persist_dir=output_dir)
+    return output_dir
+
+
+# --- Merge ---
+
+def load_store_nodes(store_path):
+    """
+    Returns the nodes of a persisted store, each with its embedding attached.
+    """
+    storage_context = StorageContext.from_defaults(persist_dir=store_path)
+    embedding_dict = storage_context.vector_store.data.embedding_dict
+    nodes = []
+    for node_id, node in storage_context.docstore.docs.items():
+        node = node.model_copy()
+        node.embedding = embedding_dict[node_id]
+        nodes.append(node)
+    return nodes
+
+
+def load_shard_nodes(shard_paths):
+    """
+    Returns the nodes of all shard stores, in the order the shards are given.
+    Raises ValueError if a node ID appears in more than one shard.
+    """
+    nodes = []
+    seen_ids = set()
+    for shard_path in shard_paths:
+        print(f"Loading shard: {shard_path}...")
+        for node in load_store_nodes(shard_path):
+            if node.node_id in seen_ids:
+                raise ValueError(f"Node {node.node_id} appears in more than one shard. "
+                                 "Were the shards split with different shard counts?")
+            seen_ids.add(node.node_id)
+            nodes.append(node)
+    return nodes
+
+
+def write_merged_store(nodes, output_dir=config.LLAMA_INDEX_STORE_PATH):
+    """
+    Persists the nodes (with embeddings) as one vector store. The nodes are
+    written in node ID order under a fixed index ID, so the store does not
+    depend on the order of the given list.
+    """
+    storage_context = StorageContext.from_defaults()
+    index_struct = IndexDict(index_id=MERGED_INDEX_ID)
+    nodes = sorted(nodes, key=lambda node: node.node_id)
+
+    # Same layout VectorStoreIndex uses for a SimpleVectorStore: embeddings in the
+    # vector store, nodes (without embeddings) in the docstore.
+    storage_context.vector_store.add(nodes)
+    for node in nodes:
+        node_without_embedding = node.model_copy()
+        node_without_embedding.embedding = None
+        index_struct.add_node(node_without_embedding, text_id=node.node_id)
+        storage_context.docstore.add_documents([node_without_embedding], allow_update=True)
+    storage_context.index_store.add_index_struct(index_struct)
+
+    if os.path.exists(output_dir):
+        shutil.rmtree(output_dir)
+    storage_context.persist(persist_dir=output_dir)
+    print(f"Merged vector store saved to: {output_dir}")
+    return output_dir
+
+
+def merge_shards(shard_paths=None, output_dir=config.LLAMA_INDEX_STORE_PATH):
+    """
+    Merges the shard stores into a single persisted vector store. Merging the
+    same shards always produces the same store, whatever order the shards are
+    given or were built in. No embeddings are recomputed.
+    """
+    shard_paths = shard_paths or list_shard_stores()
+    if not shard_paths:
+        raise FileNotFoundError(f"No shard stores found in {config.SHARD_STORE_DIR}. Build the shards first.")
+
+    nodes = load_shard_nodes(shard_paths)
+    print(f"Merging {len(nodes)} nodes from {len(shard_paths)} shards...")
+    return write_merged_store(nodes, output_dir)
+
+
+# --- Verification ---
+
+def _read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def compare_stores(store_a, store_b, atol=1e-5):
+    """
+    Compares two persisted stores node by node: same node IDs, texts and
+    metadata, and embeddings equal within atol. Returns a list of differences
+    (empty if the stores match).
+    """
+    nodes_a = {node.node_id: node for node in load_store_nodes(store_a)}
+    nodes_b = {node.node_id: node for node in load_store_nodes(store_b)}
+
+    differences = []
+    for node_id in sorted(set(nodes_a) ^ set(nodes_b)):
+        differences.append(f"{node_id}: only in {store_a if node_id in nodes_a else store_b}")
+    for node_id in sorted(set(nodes_a) & set(nodes_b)):
+        node_a, node_b = nodes_a[node_id], nodes_b[node_id]
+        if node_a.get_content() != node_b.get_content() or node_a.metadata != node_b.metadata:
+            differences.append(f"{node_id}: text or metadata differs")
+        elif not np.allclose(node_a.embedding, node_b.embedding, atol=atol):
+            differences.append(f"{node_id}: embeddings differ")
+    return differences
+
+
+def stores_identical(store_a, store_b):
+    """Returns True if the two persisted stores are byte-for-byte identical."""
+    names = sorted(os.listdir(store_a))
+    return names == sorted(os.listdir(store_b)) and all(
+        _read_bytes(os.path.join(store_a, name)) == _read_bytes(os.path.join(store_b, name))
+        for name in names
+    )
+
+
+def verify_merge_order(shard_paths, work_dir, seed=0):
+    """
+    Merges the shards as given, then again from the shards in reverse order
+    with the nodes shuffled, and checks that both stores are identical.
+    """
+    merged_dir = merge_shards(shard_paths, os.path.join(work_dir, "merged"))
+    nodes = load_shard_nodes(list(reversed(shard_paths)))
+    random.Random(seed).shuffle(nodes)
+    remerged_dir = write_merged_store(nodes, os.path.join(work_dir, "remerged"))
+    return merged_dir, stores_identical(merged_dir, remerged_dir)
+
+
+def verify_sharded_build(num_shards=config.SHARD_COUNT, input_path=None, embed_model=None,
+                         file_format=config.CLEANED_DATA_FORMAT):
+    """
+    Builds the corpus both monolithically and sharded (in a temporary
+    directory), merges the shards twice in different node orders and checks
+    that all results match. Returns True if they do.
+    """
+    input_path = input_path or default_input_path(file_format)
+    embed_model = embed_model or rag_pipeline.load_embed_model()
+    with tempfile.TemporaryDirectory() as work_dir:
+        print("--- Monolithic build ---")
+        if file_format == "jsonl":
+            documents = data_processing.load_and_prepare_fda_documents(input_path)
+        else:
+            documents = data_processing.load_and_prepare_fda_documents_columnar(input_path, file_format)
+        index, _, _ = build_knowledge_base.build_index(
+            documents, embed_model, os.path.join(work_dir, "chunk_manifest.jsonl")
+        )
+        monolithic_dir = os.path.join(work_dir, "monolithic")
+        index.storage_context.persist(persist_dir=monolithic_dir)
+
+        print(f"--- Sharded build ({num_shards} shards) ---")
+        data_dir = os.path.join(work_dir, "shard_data")
+        store_dir = os.path.join(work_dir, "shard_stores")
+        split_cleaned_data(num_shards, input_path, data_dir, file_format)
+        for shard_id in range(num_shards):
+            build_shard(shard_id, data_dir, store_dir, embed_model)
+        merged_dir, deterministic = verify_merge_order(list_shard_stores(store_dir), work_dir)
+        differences = compare_stores(monolithic_dir, merged_dir)
+
+    for difference in differences[:20]:
+        print(f"Mismatch: {difference}")
+    print(f"Sharded build matches monolithic build: {not differences} ({len(differences)} differences)")
+    print(f"Merge is deterministic: {deterministic}")
+    return not differences and deterministic
+
+
+def main():
+    """
+    Command-line entry point for the sharded build.
+    """
+    parser = argparse.ArgumentParser(description="Sharded build of the PharmaBot knowledge base.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    split_parser = subparsers.add_parser("split", help="Split the cleaned data into shards by doc_id hash")
+    split_parser.add_argument("--shards", type=int, default=config.SHARD_COUNT)
+    build_parser = subparsers.add_parser("build", help="Build the vector store of one shard")
+    build_parser.add_argument("--shard", type=int, required=True)
+    subparsers.add_parser("merge", help="Merge the shard stores into one vector store")
+    verify_parser = subparsers.add_parser("verify", help="Check that a sharded build matches a monolithic one")
+    verify_parser.add_argument("--shards", type=int, default=config.SHARD_COUNT)
+    args = parser.parse_args()
+
+    if args.command == "split":
+        split_cleaned_data(args.shards)
+    elif args.command == "build":
+        build_shard(args.shard)
+    elif args.command == "merge":
+        merge_shards()
+    elif args.command == "verify":
+        if not verify_sharded_build(args.shards):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
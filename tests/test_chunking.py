@@ -0,0 +1,50 @@
+import os
+import sys
+
+from llama_index.core import Document
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import chunking
+
+
+def make_section(doc_id, text):
+    return Document(text=text, metadata={"doc_id": doc_id, "generic_name": "IBUPROFEN"})
+
+
+def long_section():
+    subsections = []
+    for n in range(1, 6):
+        sentences = " ".join(f"Sentence {i} of subsection {n} describes storage conditions." for i in range(60))
+        subsections.append(f"2.{n} Storage Conditions {sentences}")
+    return " ".join(subsections)
+
+
+def test_manifest_reuse_matches_fresh_build(tmp_path):
+    manifest_path = str(tmp_path / "chunk_manifest.jsonl")
+    text = long_section()
+    # Two brands of one generic with an identical section share doc_id and content.
+    documents = [
+        make_section("IBUPROFEN_storage_and", text),
+        make_section("IBUPROFEN_storage_and", text),
+        make_section("IBUPROFEN_other", "Store at room temperature."),
+    ]
+
+    builds = [chunking.chunk_documents(documents, manifest_path, max_tokens=200, min_tokens=50) for _ in range(3)]
+
+    first_ids = [node.node_id for node in builds[0]]
+    assert len(first_ids) == len(set(first_ids))
+    for nodes in builds[1:]:
+        assert [node.node_id for node in nodes] == first_ids
+        assert [node.get_content() for node in nodes] == [node.get_content() for node in builds[0]]
+
+    with open(manifest_path, encoding="utf-8") as f:
+        assert sum(1 for _ in f) == len(first_ids) + 1
+
+
+def test_word_windows_fit_max_tokens():
+    # One very long "sentence": cheap words first, then words of many tokens each,
+    # so a window size estimated from the average overflows in the second half.
+    text = " ".join(["the"] * 1500 + [f"hepatotoxicity{i}/acetaminophen-{i * 7919}" for i in range(500)])
+    for start, end, tokens in chunking.chunk_section(text, max_tokens=100, min_tokens=20):
+        assert tokens <= 100
+        assert chunking.count_tokens(text[start:end]) == tokens
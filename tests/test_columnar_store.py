@@ -0,0 +1,51 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import columnar_store
+
+SECTIONS = ["Boxed Warning", "Dosage And Administration", "Warnings"]
+
+RECORDS = [
+    {"doc_id": f"GENERIC_{i % 17}_{SECTIONS[i % 3].lower().replace(' ', '_')}", "generic_name": f"GENERIC {i % 17}",
+     "brand_name": f"Brand {i}", "section": SECTIONS[i % 3], "content": f"Section text {i}."}
+    for i in range(120)
+]
+
+
+@pytest.fixture(params=columnar_store.SUPPORTED_FORMATS)
+def dataset_path(request, tmp_path):
+    path = str(tmp_path / request.param)
+    # Several row groups per section, each adding new generic and brand names.
+    assert columnar_store.write_records(iter(RECORDS), path, request.param, row_group_size=10) == len(RECORDS)
+    return path, request.param
+
+
+def test_round_trip_keeps_records_and_order(dataset_path):
+    path, file_format = dataset_path
+    records = list(columnar_store.iter_records(path, file_format))
+    for section in SECTIONS:
+        expected = [record for record in RECORDS if record["section"] == section]
+        assert [record for record in records if record["section"] == section] == expected
+    assert len(records) == len(RECORDS)
+
+
+def test_column_projection(dataset_path):
+    path, file_format = dataset_path
+    table = columnar_store.read_table(path, file_format, columns=["doc_id", "content"])
+    assert table.column_names == ["doc_id", "content"]
+    assert table.num_rows == len(RECORDS)
+    assert columnar_store.read_table(path, file_format).schema.field("generic_name").type.value_type == "string"
+
+
+def test_section_pushdown(dataset_path):
+    path, file_format = dataset_path
+    records = list(columnar_store.iter_records(path, file_format, sections=["Boxed Warning"]))
+    assert records == [record for record in RECORDS if record["section"] == "Boxed Warning"]
+
+    records = list(columnar_store.iter_records(path, file_format, sections=["Boxed Warning"],
+                                               generic_names=["generic 3"]))
+    assert records == [record for record in RECORDS
+                       if record["section"] == "Boxed Warning" and record["generic_name"] == "GENERIC 3"]
@@ -0,0 +1,61 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import name_resolver
+
+COMMON_WORDS = {"i", "have", "an", "allergy", "and", "can", "t", "sleep", "what", "clear", "it",
+                "cold", "flu", "aspirin", "with"}
+
+DRUGS = [
+    {"generic_names": ["Ibuprofen"], "brand_names": ["Advil"]},
+    {"generic_names": ["Diphenhydramine Hydrochloride"], "brand_names": ["Sleep", "Allergy", "Benadryl"]},
+    {"generic_names": ["Salicylic Acid"], "brand_names": ["Clear"]},
+    {"generic_names": ["Aspirin"], "brand_names": ["Aspirin"]},
+    {"generic_names": ["Warfarin Sodium"], "brand_names": ["Coumadin"]},
+    {"generic_names": ["Acetaminophen"], "brand_names": ["Cold and Flu"]},
+    {"generic_names": ["Amoxicillin"], "brand_names": []},
+]
+
+
+def make_resolver():
+    name_index = name_resolver.build_name_index(DRUGS, common_words=COMMON_WORDS)
+    return name_resolver.NameResolver(name_index, common_words=COMMON_WORDS)
+
+
+def test_common_words_do_not_resolve():
+    resolver = make_resolver()
+    assert resolver.resolve_query("I have an allergy and can't sleep, what clears it?") == []
+    assert resolver.resolve_query("cold and flu") == []
+
+
+def test_drug_names_resolve():
+    resolver = make_resolver()
+    assert resolver.resolve_query("warfarin and ibuprofen") == ["WARFARIN SODIUM", "IBUPROFEN"]
+    assert resolver.resolve_query("aspirin with advill") == ["ASPIRIN", "IBUPROFEN"]
+    assert resolver.resolve_query("parasetamol ve amoksisilin") == ["ACETAMINOPHEN", "AMOXICILLIN"]
+
+
+def test_fuzzy_lookup_matches_brute_force():
+    resolver = make_resolver()
+    for word in ["ibuprofn", "warfarine", "amoxicilin", "benadril", "acetaminofen", "coumadine", "zzzzzzzz"]:
+        key = name_resolver.phonetic_key(word)
+        limit = name_resolver.max_edits(len(key))
+        expected = min(name_resolver.bounded_edit_distance(key, other, limit) for other in resolver.phonetic_keys)
+        match = resolver._fuzzy_lookup(key)
+        assert (match[0] if match else limit + 1) == expected
+
+
+def test_everyday_generics_do_not_resolve():
+    drugs = DRUGS + [
+        {"generic_names": ["Alcohol"], "brand_names": ["Hand Sanitizer"]},
+        {"generic_names": ["Water"], "brand_names": ["Sterile Water"]},
+        {"generic_names": ["Isopropyl Alcohol"], "brand_names": []},
+    ]
+    # The built-in word list, as used when the NLTK corpora are not installed.
+    common_words = set(name_resolver.STOPWORDS)
+    resolver = name_resolver.NameResolver(name_resolver.build_name_index(drugs, common_words), common_words)
+    assert resolver.resolve_query("Can I drink alcohol while taking warfarin?") == ["WARFARIN SODIUM"]
+    assert resolver.resolve_query("should I take advil with water") == ["IBUPROFEN"]
+    assert resolver.resolve_query("isopropyl alcohol on the skin") == ["ISOPROPYL ALCOHOL"]
+    assert resolver.resolve_query("aspirin dosage") == ["ASPIRIN"]
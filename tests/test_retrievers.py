@@ -0,0 +1,65 @@
+import os
+import sys
+
+import numpy as np
+from llama_index.core import MockEmbedding, QueryBundle, VectorStoreIndex
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores import FilterOperator, MetadataFilter, MetadataFilters
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from retrievers import SharedEmbeddingMatrix, SharedMatrixRetriever, SharedNodeStore
+
+GENERICS = ["IBUPROFEN", "WARFARIN SODIUM", "AMOXICILLIN", "ACETAMINOPHEN"]
+
+
+def make_index(num_nodes=200, dim=16):
+    rng = np.random.default_rng(0)
+    nodes = [
+        TextNode(id_=f"node_{i:04d}", text=f"Section text {i}.", embedding=rng.normal(size=dim).tolist(),
+                 metadata={"generic_name": GENERICS[i % len(GENERICS)], "section": "Warnings", "doc_id": f"doc_{i}"})
+        for i in range(num_nodes)
+    ]
+    embed_model = MockEmbedding(embed_dim=dim)
+    return VectorStoreIndex(nodes, embed_model=embed_model), embed_model, rng
+
+
+def generic_filter(operator, value):
+    return MetadataFilters(filters=[MetadataFilter(key="generic_name", value=value, operator=operator)])
+
+
+FILTERS = [
+    None,
+    generic_filter(FilterOperator.EQ, "WARFARIN SODIUM"),
+    generic_filter(FilterOperator.IN, ["IBUPROFEN", "AMOXICILLIN"]),
+]
+
+
+def test_shared_matrix_retriever_matches_vector_index():
+    index, embed_model, rng = make_index()
+    queries = [QueryBundle("query", embedding=rng.normal(size=16).tolist()) for _ in range(10)]
+    # Retrieved before from_index releases the embeddings of the vector store.
+    reference_results = [
+        [index.as_retriever(similarity_top_k=5, filters=filters).retrieve(query) for query in queries]
+        for filters in FILTERS
+    ]
+
+    shared_matrix = SharedEmbeddingMatrix.from_index(index)
+    node_store = SharedNodeStore.from_docstore(index.docstore, shared_matrix.node_ids)
+    for filters, expected_results in zip(FILTERS, reference_results):
+        retriever = SharedMatrixRetriever(shared_matrix, node_store, embed_model, similarity_top_k=5, filters=filters)
+        for query, expected in zip(queries, expected_results):
+            results = retriever.retrieve(query)
+            assert len(results) == 5
+            assert [n.node.node_id for n in results] == [n.node.node_id for n in expected]
+            assert np.allclose([n.score for n in results], [n.score for n in expected], atol=1e-5)
+            assert [n.node.get_content() for n in results] == [n.node.get_content() for n in expected]
+            assert [n.node.metadata for n in results] == [n.node.metadata for n in expected]
+
+
+def test_shared_node_store_round_trip():
+    index, _, _ = make_index(num_nodes=20)
+    node_ids = sorted(index.docstore.docs)
+    node_store = SharedNodeStore.from_docstore(index.docstore, node_ids)
+    assert len(node_store) == 20
+    for row, node_id in enumerate(node_ids):
+        assert node_store.get_node(row) == index.docstore.get_node(node_id)
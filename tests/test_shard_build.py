@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+from llama_index.core import MockEmbedding, VectorStoreIndex
+from llama_index.core.schema import TextNode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import build_knowledge_base
+import columnar_store
+import data_processing
+import shard_build
+
+
+class HashEmbedding(MockEmbedding):
+    """MockEmbedding with a different (deterministic) vector per text."""
+
+    def _get_text_embedding(self, text):
+        seed = int.from_bytes(hashlib.md5(text.encode("utf-8")).digest()[:4], "big")
+        return np.random.default_rng(seed).normal(size=self.embed_dim).tolist()
+
+
+RECORDS = [
+    {"doc_id": f"{generic}_{section.lower().replace(' ', '_')}", "generic_name": generic,
+     "brand_name": brand, "section": section, "content": f"{section} text for {brand}."}
+    for generic, brand in [("IBUPROFEN", "Advil"), ("WARFARIN SODIUM", "Coumadin"), ("AMOXICILLIN", "Amoxil"),
+                           ("ACETAMINOPHEN", "Tylenol"), ("ASPIRIN", "Bayer")]
+    for section in ["Boxed Warning", "Dosage And Administration", "Warnings"]
+]
+
+
+def read_shards(data_dir, num_shards):
+    shards = []
+    for shard_id in range(num_shards):
+        with open(shard_build.shard_data_path(shard_id, data_dir), encoding="utf-8") as f:
+            shards.append(sorted((json.loads(line) for line in f), key=lambda record: record["doc_id"]))
+    return shards
+
+
+def test_split_reads_configured_format(tmp_path):
+    jsonl_path = tmp_path / "cleaned.jsonl"
+    jsonl_path.write_text("\n".join(json.dumps(record) for record in RECORDS), encoding="utf-8")
+    columnar_path = str(tmp_path / "columnar")
+    columnar_store.write_records(iter(RECORDS), columnar_path, "parquet")
+
+    jsonl_counts = shard_build.split_cleaned_data(3, str(jsonl_path), str(tmp_path / "from_jsonl"), "jsonl")
+    parquet_counts = shard_build.split_cleaned_data(3, columnar_path, str(tmp_path / "from_parquet"), "parquet")
+
+    assert jsonl_counts == parquet_counts and sum(jsonl_counts) == len(RECORDS)
+    assert read_shards(str(tmp_path / "from_parquet"), 3) == read_shards(str(tmp_path / "from_jsonl"), 3)
+
+
+def test_split_missing_or_unknown_input(tmp_path):
+    with pytest.raises(FileNotFoundError, match="dataPrep.py"):
+        shard_build.split_cleaned_data(2, str(tmp_path / "missing"), str(tmp_path / "shards"), "parquet")
+    with pytest.raises(ValueError, match="CLEANED_DATA_FORMAT"):
+        shard_build.split_cleaned_data(2, str(tmp_path / "cleaned.csv"), str(tmp_path / "shards"), "csv")
+    assert not os.path.exists(tmp_path / "shards")
+
+
+def test_merge_does_not_depend_on_node_order(tmp_path):
+    embed_model = MockEmbedding(embed_dim=8)
+    shard_paths = []
+    for shard_id in range(3):
+        nodes = [TextNode(id_=f"node_{shard_id}_{i}", text=f"Chunk {i} of shard {shard_id}.") for i in range(10)]
+        shard_path = shard_build.shard_store_path(shard_id, str(tmp_path / "stores"))
+        VectorStoreIndex(nodes, embed_model=embed_model).storage_context.persist(persist_dir=shard_path)
+        shard_paths.append(shard_path)
+
+    for seed in range(3):
+        _, identical = shard_build.verify_merge_order(shard_paths, str(tmp_path / f"work_{seed}"), seed=seed)
+        assert identical
+
+
+def long_section(brand):
+    subsections = []
+    for n in range(1, 5):
+        sentences = " ".join(f"Sentence {i} of subsection {n} about {brand} and bleeding risk." for i in range(60))
+        subsections.append(f"5.{n} Bleeding Risk {sentences}")
+    return " ".join(subsections)
+
+
+def test_sharded_build_matches_monolithic_build(tmp_path):
+    # Long sections are split into several chunks; two brands of a generic share a section.
+    records = RECORDS + [
+        {"doc_id": f"{generic}_warnings_and_precautions", "generic_name": generic, "brand_name": brand,
+         "section": "Warnings And Precautions", "content": long_section(generic)}
+        for generic, brand in [("WARFARIN SODIUM", "Coumadin"), ("WARFARIN SODIUM", "Jantoven"),
+                               ("IBUPROFEN", "Advil")]
+    ]
+    input_path = str(tmp_path / "cleaned.jsonl")
+    with open(input_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(json.dumps(record) for record in records))
+    embed_model = HashEmbedding(embed_dim=8)
+
+    documents = data_processing.load_and_prepare_fda_documents(input_path)
+    index, nodes, _ = build_knowledge_base.build_index(documents, embed_model, str(tmp_path / "manifest.jsonl"))
+    assert len(nodes) > len(RECORDS) + 2
+    monolithic_dir = str(tmp_path / "monolithic")
+    index.storage_context.persist(persist_dir=monolithic_dir)
+
+    data_dir, store_dir = str(tmp_path / "shard_data"), str(tmp_path / "shard_stores")
+    counts = shard_build.split_cleaned_data(3, input_path, data_dir, "jsonl")
+    assert all(counts)
+    for shard_id in range(3):
+        shard_build.build_shard(shard_id, data_dir, store_dir, embed_model)
+    merged_dir = shard_build.merge_shards(shard_build.list_shard_stores(store_dir), str(tmp_path / "merged"))
+
+    assert shard_build.compare_stores(monolithic_dir, merged_dir) == []
+
+
+def test_verify_sharded_build_from_columnar_data(tmp_path):
+    columnar_path = str(tmp_path / "columnar")
+    columnar_store.write_records(iter(RECORDS), columnar_path, "arrow", row_group_size=4)
+    assert shard_build.verify_sharded_build(3, columnar_path, HashEmbedding(embed_dim=8), "arrow")